@@ -0,0 +1,100 @@
+"""Import-time budget for the non-GUI commands.
+
+Runs each command path in a fresh interpreter under `python -X importtime`,
+reports the slowest imports and fails if the median total import time goes
+over budget or if any of the heavy GUI/API modules get loaded.
+
+    python benchmarks/startup.py [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "150"))
+
+# Modules only the `run` command may load
+HEAVY_MODULES = ["tkinter", "pystray", "PIL", "pyaudio", "openai", "httpx", "speech_recognition", "agent", "gui"]
+
+# Each snippet does what the command does up to (but not including) its side effects
+COMMANDS = {
+    # argparse exits after printing help; catch it so the heavy-module check still runs
+    "--help": "import sys; sys.argv = ['fleetcast', '--help']; import main\n"
+              "try:\n    main.main()\nexcept SystemExit:\n    pass",
+    "config": "import main, settings",
+}
+
+CHECK_SNIPPET = """
+import sys
+loaded = [m for m in {heavy!r} if m in sys.modules]
+if loaded:
+    sys.stderr.write("HEAVY:" + ",".join(loaded) + "\\n")
+"""
+
+
+def run_once(snippet):
+    """Run a snippet in a fresh interpreter, returning (total_ms, imports, heavy_loaded)."""
+    code = snippet + "\n" + CHECK_SNIPPET.format(heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Command failed:\n{result.stderr}")
+
+    total_us = 0
+    imports = []
+    heavy = []
+    for line in result.stderr.splitlines():
+        if line.startswith("HEAVY:"):
+            heavy = line[len("HEAVY:"):].split(",")
+            continue
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        cumulative_us = int(parts[1])
+        name = parts[2]
+        # Only top-level imports count towards the total; nested ones are in their cumulative
+        if not name.startswith("  "):
+            total_us += cumulative_us
+        imports.append((cumulative_us, name.strip()))
+
+    return total_us / 1000, imports, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleetcast startup benchmark")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="Import-time budget per command")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command (median is reported)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    failed = False
+    for command, snippet in COMMANDS.items():
+        totals = []
+        imports = []
+        heavy = []
+        for _ in range(args.runs):
+            total_ms, imports, heavy = run_once(snippet)
+            totals.append(total_ms)
+
+        median = statistics.median(totals)
+        status = "ok" if median <= args.budget_ms and not heavy else "FAIL"
+        print(f"{command}: {median:.1f} ms median import time (budget {args.budget_ms:.0f} ms) [{status}]")
+        for cumulative_us, name in sorted(imports, reverse=True)[:args.top]:
+            print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+        if heavy:
+            print(f"    loaded GUI/API modules: {', '.join(heavy)}")
+        if status != "ok":
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
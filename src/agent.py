@@ -1,58 +1,119 @@
 import json
-import random
 import time
 import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from functools import partial
 from datetime import datetime
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from persona_generation import generate_personas
-import certifi
-import ssl
-import httpx
+from persona_generation import PERSONAS_FILE, is_generating, start_background_generation
+from cassette import chat_completion, make_rng
+from clients import get_openai_client
+from rate_controller import RateController, is_rate_limit_error
+from routing import TIER_MAX_CONCURRENCY, group_by_tier, tier_stats
+from session_log import SESSION_RESTORE_MINUTES, get_session_log
+from speculation import SPECULATIVE_GENERATION, Speculator
+from reactions import INSTANT_REACTIONS, ReactionCache
+from coalescer import COALESCE_UTTERANCES, Coalescer
+from tracing import span, trace
 
 load_dotenv()
 
-OPENAI_MODEL = os.getenv("OPENAI_MODEL_NAME")
 SELECTION_CHANCE = float(os.getenv("SELECTION_CHANCE", "0.9"))
 DECISION_CHANCE = float(os.getenv("DECISION_CHANCE", "0.9"))
-TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
-MAX_TOKENS = int(os.getenv("MAX_TOKENS", "150"))
 MIN_DELAY = float(os.getenv("MIN_DELAY", "2.0"))  # seconds
 MAX_DELAY = float(os.getenv("MAX_DELAY", "8.0"))  # seconds
 OUTPUT_FILE = os.getenv("AI_OUTPUT_FILE_NAME", "chat_output.txt")
 WRITE_OUTPUT_TO_FILE = os.getenv("WRITE_OUTPUT_TO_FILE", "True").lower() == "true"
 CHAT_CONTEXT = os.getenv("CHAT_CONTEXT", "")
 USERNAME = os.getenv("SPEAKER_USERNAME", "User")
-
-# Initialize OpenAI client (auto-loads OPENAI_API_KEY from environment)
-os.environ.pop("SSL_CERT_FILE", None)
-    
-client = OpenAI(
-api_key=os.getenv("OPENAI_API_KEY"),
-http_client=httpx.Client(
-    verify=certifi.where()
-))
+# Entries kept in conversation memory (only the last few go into prompts)
+CONVERSATION_MEMORY_LIMIT = int(os.getenv("CONVERSATION_MEMORY_LIMIT", "200"))
 
 # Global conversation memory
-conversation_memory = []
+conversation_memory = deque(maxlen=CONVERSATION_MEMORY_LIMIT)
+
+# Seedable RNG for persona selection and posting order/delays, so a recorded
+# session replays with the same choices (see cassette.py)
+rng = make_rng()
+# Speculative requests draw from their own RNG so they don't shift rng's sequence
+speculation_rng = make_rng()
+
+# Adjusts DECISION_CHANCE/SELECTION_CHANCE live towards TARGET_MESSAGES_PER_MINUTE
+# and backs off under token/request budget pressure (see rate_controller.py)
+rate_controller = RateController(DECISION_CHANCE, SELECTION_CHANCE)
+
+# Runs the requests for additional model tiers alongside the first (see routing.py)
+_tier_executor = ThreadPoolExecutor(max_workers=TIER_MAX_CONCURRENCY, thread_name_prefix="tier")
+
+# Set when shutting down: posting stops between messages, and responses not yet
+# posted stay pending in the session log to be resumed on the next start
+stop_posting = threading.Event()
+
+async def _post_sleep(seconds):
+    """asyncio.sleep that ends early once stop_posting is set"""
+    await asyncio.get_running_loop().run_in_executor(None, stop_posting.wait, seconds)
+
+# Awaitable used for the delays between posts; the soak harness swaps in a virtual clock
+post_sleep = _post_sleep
+
+# Callbacks notified of every posted chat message as callback(name, message, latency),
+# where latency is seconds since the utterance was received. They run on the
+# posting thread, so UI listeners must hand off to their own thread.
+message_listeners = []
+
+def add_message_listener(callback):
+    """Register a callback for posted chat messages"""
+    message_listeners.append(callback)
+
+def notify_message_listeners(name, message, received_at=None):
+    """Notify listeners of a posted message"""
+    latency = time.monotonic() - received_at if received_at is not None else None
+    for callback in message_listeners:
+        try:
+            callback(name, message, latency)
+        except Exception as e:
+            print(f"Error in message listener: {e}")
+
+# Parsed personas.json, reused until the file changes on disk
+_personas_cache = {"stat": None, "data": {"personas": []}}
+
+def ensure_personas():
+    """Start background persona generation if personas.json is missing or empty.
+
+    Returns True if generation was started. Generated personas are written to the
+    file incrementally, so load_personas picks them up as they arrive.
+    """
+    if os.path.exists(PERSONAS_FILE) and os.path.getsize(PERSONAS_FILE) > 0:
+        return False
+    if is_generating():
+        return True
+
+    print(f"{PERSONAS_FILE} is missing or empty. Generating personas in the background.")
+    start_background_generation(PERSONAS_FILE, rng=rng)
+    return True
 
 def load_personas():
-    """Load personas from personas.json file"""
+    """Load personas from personas.json file (never blocks on generation)"""
     try:
-        if os.path.exists('personas.json') and os.path.getsize('personas.json') == 0:
-            print("personas.json is empty. Generating personas.")
-            personas = generate_personas()
-            with open('personas.json', 'w') as f:
-                json.dump(personas, f, indent=4)
-            return personas
+        stat = os.stat(PERSONAS_FILE)
+        if stat.st_size == 0:
+            ensure_personas()
+            return {"personas": []}
 
-        with open('personas.json', 'r') as f:
-            return json.load(f)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if _personas_cache["stat"] != key:
+            with open(PERSONAS_FILE, 'r') as f:
+                _personas_cache["data"] = json.load(f)
+            _personas_cache["stat"] = key
+        return _personas_cache["data"]
 
     except FileNotFoundError:
-        print("personas.json not found. Using default personas.")
-        return generate_personas()
+        ensure_personas()
+        return {"personas": []}
 
 def load_system_prompt():
     """Load system prompt from env or use default."""
@@ -67,36 +128,64 @@ def get_chat_context():
     context = CHAT_CONTEXT.strip() if CHAT_CONTEXT else ""
     return context
 
-def select_active_personas(personas_data):
-    """Select which personas will respond (each has SELECTION_CHANCE probability)"""
+def select_active_personas(personas_data, rng=rng):
+    """Select which personas will respond (each with the controller's selection probability)"""
     personas = personas_data.get('personas', [])
     if not personas:
         return []
     
+    selection_chance = rate_controller.selection_chance()
     active_personas = []
     for persona in personas:
-        if random.random() < SELECTION_CHANCE:
+        if rng.random() < selection_chance:
             active_personas.append(persona)
     
     # Ensure at least one persona responds if decision is made
     if not active_personas and personas:
-        active_personas.append(random.choice(personas))
+        active_personas.append(rng.choice(personas))
     
     return active_personas
 
 def make_decision():
-    """Make a decision with DECISION_CHANCE probability of returning True"""
-    return random.random() < DECISION_CHANCE
+    """Decide whether chat responds, using the controller's decision probability.
+
+    Also returns False, after rolling, when the API budget is exhausted or we
+    are backing off from rate limiting, so requests are skipped rather than queued.
+    """
+    if rng.random() >= rate_controller.decision_chance():
+        return False
+    if not rate_controller.allow_request():
+        print("Skipping response: API budget reached or backing off")
+        return False
+    return True
+
+def _memory_entry(speaker, text, t):
+    timestamp = datetime.fromtimestamp(t).strftime("%H:%M:%S")
+    return f"[{timestamp}] {speaker}: {text}"
 
 def add_to_conversation_memory(speaker, text):
     """Add to conversation memory in the format [TIME] speaker: text"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    memory_entry = f"[{timestamp}] {speaker}: {text}"
-    conversation_memory.append(memory_entry)
+    now = time.time()
+    conversation_memory.append(_memory_entry(speaker, text, now))
+    get_session_log().record_memory(speaker, text, now)
+
+def restore_session():
+    """Reload recent conversation memory from the session log and resume unposted responses.
+
+    Returns the number of responses resumed; they are posted on a background thread.
+    """
+    entries, pending = get_session_log().restore(SESSION_RESTORE_MINUTES)
+    for t, speaker, text in entries:
+        conversation_memory.append(_memory_entry(speaker, text, t))
+    if entries or pending:
+        print(f"Restored {len(entries)} conversation entries and {len(pending)} pending responses")
+    if pending:
+        threading.Thread(target=lambda: asyncio.run(post_responses_with_delay(pending)), daemon=True).start()
+    return len(pending)
 
 def get_conversation_context(max_entries=8):
     """Get recent conversation context for API call"""
-    recent_memory = conversation_memory[-max_entries:] if len(conversation_memory) > max_entries else conversation_memory
+    recent_memory = list(conversation_memory)[-max_entries:]
     return "\n".join(recent_memory)
 
 def create_persona_prompt(active_personas):
@@ -112,35 +201,26 @@ def create_persona_prompt(active_personas):
     
     return "\n".join(persona_details)
 
-def api_call_structured(text):
-    """Make single OpenAI API call and get structured JSON response"""
-    try:
-        # Load personas and select active ones
-        personas_data = load_personas()
-        active_personas = select_active_personas(personas_data)
-        
-        if not active_personas:
-            print("No personas selected to respond")
-            return []
+def build_messages(text, active_personas):
+    """Build the chat completion messages for the active personas"""
+    # Get conversation context and chat topic
+    context = get_conversation_context()
+    chat_topic = get_chat_context()
+    system_prompt = load_system_prompt()
+    persona_prompt = create_persona_prompt(active_personas)
 
-        # Get conversation context and chat topic
-        context = get_conversation_context()
-        chat_topic = get_chat_context()
-        system_prompt = load_system_prompt()
-        persona_prompt = create_persona_prompt(active_personas)
-
-        # Build context section for the prompt
-        context_section = ""
-        if chat_topic:
-            context_section += f"\nDiscussion Topic/Context: {chat_topic}"
-        if context:
-            context_section += f"\nRecent conversation:\n{context}"
-
-        # Create the structured prompt
-        messages = [
-            {
-                "role": "system", 
-                "content": f"""{system_prompt}
+    # Build context section for the prompt
+    context_section = ""
+    if chat_topic:
+        context_section += f"\nDiscussion Topic/Context: {chat_topic}"
+    if context:
+        context_section += f"\nRecent conversation:\n{context}"
+
+    # Create the structured prompt
+    messages = [
+        {
+            "role": "system", 
+            "content": f"""{system_prompt}
 
 You are simulating these specific chat users:
 {persona_prompt}{context_section}
@@ -160,114 +240,280 @@ IMPORTANT: Respond with ONLY a valid JSON object in this exact format:
 }}
 
 Each persona should respond in their own unique style based on their personality and interests. Keep responses short and natural for live chat (1-2 sentences max). Make sure responses are relevant to the discussion topic and current conversation. Only include personas that would realistically respond to this message."""
-            },
-            {
-                "role": "user", 
-                "content": text
-            }
-        ]
-
-        # Make single API call (OpenAI v1.x style)
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            max_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE,
-            response_format={"type": "json_object"}
-        )
-
-        # Parse JSON response
-        response_text = response.choices[0].message.content.strip()
-        
-        try:
-            response_data = json.loads(response_text)
-            return response_data.get('responses', [])
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON response: {e}")
-            print(f"Raw response: {response_text}")
+        },
+        {
+            "role": "user", 
+            "content": text
+        }
+    ]
+
+    return messages
+
+def _request_tier(text, tier_name, tier, personas, retries=0, cassette_tag=None):
+    """Make one API call for the personas in a tier and return their responses"""
+    with span("build_prompt", tier=tier_name) as prompt_span:
+        messages = build_messages(text, personas)
+        prompt_span.set(chars=sum(len(m["content"]) for m in messages))
+
+    start = time.monotonic()
+    try:
+        with span("llm_request", tier=tier_name, model=tier["model"], personas=len(personas),
+                  retries=retries) as request_span:
+            response = chat_completion(
+                get_openai_client,
+                cassette_tag=cassette_tag or tier_name,
+                model=tier["model"],
+                messages=messages,
+                max_tokens=tier["max_tokens"],
+                temperature=tier["temperature"],
+                response_format={"type": "json_object"}
+            )
+            usage = getattr(response, "usage", None)
+            request_span.set(prompt_tokens=getattr(usage, "prompt_tokens", 0),
+                             completion_tokens=getattr(usage, "completion_tokens", 0))
+    except Exception:
+        tier_stats.record(tier_name, time.monotonic() - start, error=True)
+        raise
+    tier_stats.record(tier_name, time.monotonic() - start, usage)
+    rate_controller.record_request(getattr(usage, "total_tokens", 0))
+
+    # Parse JSON response
+    response_text = response.choices[0].message.content.strip()
+
+    try:
+        response_data = json.loads(response_text)
+        return response_data.get('responses', [])
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse JSON response ({tier_name} tier): {e}")
+        print(f"Raw response: {response_text}")
+        return []
+
+def _handle_api_error(e):
+    if is_rate_limit_error(e):
+        rate_controller.record_rate_limited()
+    print(f"Error during API call: {e}")
+    add_to_conversation_memory("System", f"Error occurred: {str(e)}")
+
+def _request_tier_safe(*args, **kwargs):
+    try:
+        return _request_tier(*args, **kwargs)
+    except Exception as e:
+        _handle_api_error(e)
+        return []
+
+def api_call_structured(text, retries=0, speculative=False):
+    """Get structured JSON responses, with one concurrent API call per model tier.
+
+    Speculative requests (see speculation.py) use speculation_rng and their own
+    cassette tags, so a recorded session replays the real requests unchanged.
+    """
+    try:
+        # Load personas and select active ones
+        with span("load_personas"):
+            personas_data = load_personas()
+        with span("select_personas") as select_span:
+            active_personas = select_active_personas(personas_data, speculation_rng if speculative else rng)
+            select_span.set(persona_count=len(personas_data.get('personas', [])), active_count=len(active_personas))
+
+        if not active_personas:
+            print("No personas selected to respond")
             return []
 
+        groups = group_by_tier(active_personas, personas_data)
     except Exception as e:
-        print(f"Error during API call: {e}")
-        add_to_conversation_memory("System", f"Error occurred: {str(e)}")
+        _handle_api_error(e)
         return []
 
-async def post_responses_with_delay(responses):
+    requests = [
+        (text, tier_name, tier, personas, retries, f"speculative:{tier_name}" if speculative else None)
+        for tier_name, (tier, personas) in groups.items()
+    ]
+    # The caller checked the budget for one request; drop tiers it can't cover
+    while len(requests) > 1 and not rate_controller.allow_request(len(requests), count_skip=False):
+        dropped = requests.pop()
+        print(f"Skipping {dropped[1]} tier request: API budget reached")
+
+    # Other tiers go to the pool (with this trace's context); the first runs here
+    futures = [
+        _tier_executor.submit(contextvars.copy_context().run, _request_tier_safe, *request)
+        for request in requests[1:]
+    ]
+    responses = _request_tier_safe(*requests[0])
+    for future in futures:
+        responses = responses + future.result()
+    return responses
+
+def post_response(name, message, received_at=None, echo=False):
+    """Post one chat message to memory, listeners and the output file"""
+    with span("post", persona=name, chars=len(message)):
+        add_to_conversation_memory(name, message)
+        rate_controller.record_messages()
+        notify_message_listeners(name, message, received_at)
+        
+        # Write to file if enabled
+        if WRITE_OUTPUT_TO_FILE:
+            with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                f.write(f"[{timestamp}] [{name}]: {message}\n")
+                if echo:
+                    print(f"[{timestamp}] [{name}]: {message}\n")
+
+async def post_responses_with_delay(responses, received_at=None):
     """Post responses with natural delays between them"""
     if not responses:
         return
     
     # Shuffle responses for more natural ordering
     shuffled_responses = responses.copy()
-    random.shuffle(shuffled_responses)
+    rng.shuffle(shuffled_responses)
+    # Logged so responses still waiting to be posted survive a restart
+    post_ids = get_session_log().schedule(shuffled_responses)
     
     for i, response in enumerate(shuffled_responses):
+        if stop_posting.is_set():
+            print(f"Stopping with {len(shuffled_responses) - i} responses left for the next start")
+            return
         name = response.get('name', 'Unknown')
         message = response.get('message', '')
         
         if not message.strip():
+            get_session_log().mark_done(post_ids[i])
             continue
         
         # Add to conversation memory and display
-        add_to_conversation_memory(name, message)
-        
-        # Write to file if enabled
-        if WRITE_OUTPUT_TO_FILE:
-            with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                f.write(f"[{timestamp}] [{name}]: {message}\n")
-                print(f"[{timestamp}] [{name}]: {message}\n")
-
+        post_response(name, message, received_at, echo=True)
+        get_session_log().mark_done(post_ids[i])
         
         # Add delay before next response (except for the last one)
         if i < len(shuffled_responses) - 1:
-            delay = random.uniform(MIN_DELAY, MAX_DELAY)
-            await asyncio.sleep(delay)
+            delay = rng.uniform(MIN_DELAY, MAX_DELAY)
+            with span("post_delay", seconds=delay):
+                await post_sleep(delay)
+
+# Starts requests on partial transcripts so chat can react as the sentence ends
+speculator = (Speculator(partial(api_call_structured, speculative=True), rate_controller.allow_request)
+              if SPECULATIVE_GENERATION else None)
+
+# Short pre-generated reactions posted right away while the full request runs
+reactions = (ReactionCache(rate_controller.allow_request, rate_controller.record_request)
+             if INSTANT_REACTIONS else None)
+
+def print_stats():
+    """Print speculation, reaction, coalescing, tier and rate controller stats"""
+    if speculator:
+        print(f"Speculation stats: {speculator.stats()}")
+    if reactions:
+        print(f"Reaction stats: {reactions.stats()}")
+    if coalescer:
+        print(f"Coalescing stats: {coalescer.stats()}")
+    tier_stats.print_summary()
+    rate_controller.print_summary()
+
+def warm_reactions():
+    """Start filling the reaction pools before the first utterance"""
+    if reactions:
+        reactions.refill(load_personas())
+
+def on_partial_text(text, speaker=None):
+    """Triggered with the transcript so far while the speaker is still talking"""
+    if speculator:
+        speculator.on_partial(text, speaker)
 
-def on_text_received(text):
-    """Triggered when text is received - now uses async for natural timing"""
+def on_text_received(text, speaker=None):
+    """Triggered when text is received - now uses async for natural timing.
+
+    speaker labels the input the text came from (see input_devices in
+    config.json) and defaults to SPEAKER_USERNAME. With COALESCE_UTTERANCES
+    this returns immediately and the response is generated by the coalescer.
+    """
+    with trace(), span("utterance", chars=len(text)):
+        if coalescer:
+            add_to_conversation_memory(speaker or USERNAME, text)
+            coalescer.submit(text, speaker or USERNAME)
+        else:
+            _respond_to_text(text, speaker or USERNAME)
+
+def _respond_to_text(text, speaker):
+    received_at = time.monotonic()
     
     # Add text to conversation memory as user input
-    add_to_conversation_memory(USERNAME, text)
-    
+    add_to_conversation_memory(speaker, text)
+    _generate_response(text, received_at, speaker=speaker)
+
+def _respond_to_batch(batch):
+    """Coalescer handler: one request for all utterances merged into the batch"""
+    with trace(), span("coalesced", utterances=len(batch.parts), speakers=len(batch.speakers)):
+        _generate_response(batch.text, batch.received_at, batch, batch.speaker)
+
+def _generate_response(text, received_at, batch=None, speaker=None):
     # Make decision to respond
     if make_decision():
-        # Get structured responses
-        responses = api_call_structured(text)
+        if reactions:
+            with span("reaction"):
+                reactions.react(text, load_personas(),
+                                lambda name, message: post_response(name, message, received_at, echo=True))
+
+        responses = None
+        retries = 0
+        if batch and batch.speaker is None:
+            # A speculation follows one speaker's partials, so it can't match text merged from several
+            _discard_speculation(batch.speakers)
+        elif speculator:
+            # Use the speculative request if it was made on (nearly) this text
+            responses = speculator.take(text, speaker)
+            retries = 1 if speculator.last_outcome == "miss" else 0
+        if responses is None:
+            # Get structured responses (a retry if the speculation missed)
+            responses = api_call_structured(text, retries=retries)
         
+        if batch and not batch.commit():
+            print("Dropping responses superseded by newer speech")
+            return
         if responses:
             # Run the async function to post responses with delays
-            asyncio.run(post_responses_with_delay(responses))
+            asyncio.run(post_responses_with_delay(responses, received_at))
         else:
             print("No valid responses received")
+    else:
+        _discard_speculation(batch.speakers if batch else [speaker])
+
+def _discard_speculation(speakers):
+    """Drop the in-flight speculation if it was made on one of these speakers' speech"""
+    if speculator:
+        for speaker in speakers:
+            speculator.discard(speaker)
+
+# Merges utterances that arrive close together or during a request (see coalescer.py)
+coalescer = Coalescer(_respond_to_batch) if COALESCE_UTTERANCES else None
 
 # Synchronous version for non-async environments
-def post_responses_with_delay_sync(responses):
+def post_responses_with_delay_sync(responses, received_at=None):
     """Synchronous version of posting responses with delays"""
     if not responses:
         return
     
     # Shuffle responses for more natural ordering
     shuffled_responses = responses.copy()
-    random.shuffle(shuffled_responses)
+    rng.shuffle(shuffled_responses)
+    post_ids = get_session_log().schedule(shuffled_responses)
     
     for i, response in enumerate(shuffled_responses):
+        if stop_posting.is_set():
+            print(f"Stopping with {len(shuffled_responses) - i} responses left for the next start")
+            return
         name = response.get('name', 'Unknown')
         message = response.get('message', '')
         
         if not message.strip():
+            get_session_log().mark_done(post_ids[i])
             continue
         
         # Add to conversation memory and display
-        add_to_conversation_memory(name, message)
-        
-        # Write to file if enabled
-        if WRITE_OUTPUT_TO_FILE:
-            with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                f.write(f"[{timestamp}] [{name}]: {message}\n")
+        post_response(name, message, received_at)
+        get_session_log().mark_done(post_ids[i])
         
         # Add delay before next response (except for the last one)
         if i < len(shuffled_responses) - 1:
-            delay = random.uniform(MIN_DELAY, MAX_DELAY)
-            time.sleep(delay)
+            delay = rng.uniform(MIN_DELAY, MAX_DELAY)
+            with span("post_delay", seconds=delay):
+                stop_posting.wait(delay)
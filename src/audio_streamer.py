@@ -1,201 +1,637 @@
 import threading
 import time
-import wave
-import tempfile
 import os
+import math
+from array import array
+from collections import deque
 from dotenv import load_dotenv
 
 import pyaudio
 import speech_recognition as sr
 
+from cassette import get_cassette, request_key
+from device_registry import DEFAULT_DEVICE, get_registry
+from speculation import SPECULATIVE_INTERVAL_SECONDS
+from tracing import span, trace
+
+try:
+    import numpy as np
+except ImportError:  # optional: mixdown falls back to pure Python
+    np = None
+
+load_dotenv()
+
 AUDIO_PROCESS_SECONDS = float(os.getenv("AUDIO_PROCESS_SECONDS", "20"))
+# Most unprocessed audio kept if recognition stalls; older audio is dropped
+MAX_BUFFER_SECONDS = float(os.getenv("MAX_BUFFER_SECONDS", str(AUDIO_PROCESS_SECONDS * 3)))
 USERNAME = os.getenv("SPEAKER_USERNAME", "User")
+# How long capture waits for the first device enumeration before using config as-is
+DEVICE_WAIT_SECONDS = 3
+
+# Voice activity detection: chunks louder than this RMS level (0-1) count as
+# speech, and a segment is transcribed after VAD_SILENCE_SECONDS of quiet
+# (or AUDIO_PROCESS_SECONDS at most). 0 disables VAD: fixed windows, as before.
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0"))
+VAD_SILENCE_SECONDS = float(os.getenv("VAD_SILENCE_SECONDS", "1.0"))
+# Audio kept from before speech starts so the first word isn't clipped
+VAD_PREROLL_SECONDS = 0.3
+# Chunks one input may run ahead of the others before the mixdown stops waiting for them
+MIX_MAX_LAG_CHUNKS = 4
+
+
+def input_configs(config):
+    """Per-input settings from config.json.
+
+    "input_devices" lists several inputs, e.g.
+    [{"input_device_name": "USB Mic", "speaker": "Alex"}, {"input_device_name": "Loopback", "speaker": "Game"}];
+    without it the single input_device/input_device_name is used.
+    """
+    devices = config.get("input_devices")
+    if not devices:
+        return [{
+            "input_device": config.get("input_device"),
+            "input_device_name": config.get("input_device_name", "Default"),
+            "fallback_input_device_name": config.get("fallback_input_device_name", "Default"),
+            "speaker": USERNAME,
+        }]
+
+    inputs = []
+    for i, device in enumerate(devices):
+        inputs.append({
+            "input_device": device.get("input_device"),
+            "input_device_name": device.get("input_device_name", "Default"),
+            # Only the first input falls back by default; an extra mic falling back
+            # to the default device would just duplicate the host
+            "fallback_input_device_name": device.get(
+                "fallback_input_device_name",
+                config.get("fallback_input_device_name", "Default") if i == 0 else None,
+            ),
+            "speaker": device.get("speaker") or USERNAME,
+        })
+    return inputs
+
+
+def measure_level(data):
+    """RMS level of a 16-bit chunk, scaled to 0-1."""
+    # Every 4th sample is plenty for a meter and keeps the capture loop cheap
+    samples = array('h', data)[::4]
+    if not samples:
+        return 0.0
+    rms = math.sqrt(sum(s * s for s in samples) / len(samples))
+    return min(1.0, rms / 32768.0)
+
+
+def mix_chunks(chunks):
+    """Sum 16-bit chunks into one, clipping instead of wrapping around."""
+    if len(chunks) == 1:
+        return chunks[0]
+    length = max(len(c) for c in chunks) // 2
+
+    if np is not None:
+        total = np.zeros(length, dtype=np.int32)
+        for chunk in chunks:
+            samples = np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // 2)
+            total[:len(samples)] += samples
+        return np.clip(total, -32768, 32767).astype(np.int16).tobytes()
+
+    total = [0] * length
+    for chunk in chunks:
+        for i, s in enumerate(array('h', chunk[:len(chunk) // 2 * 2])):
+            total[i] += s
+    return array('h', [max(-32768, min(32767, s)) for s in total]).tobytes()
+
+
+class Mixer:
+    """Combines chunks from several inputs into a single feed.
+
+    Chunks are mixed once every input has one queued; an input that falls
+    silent (unplugged, stalled) is treated as silence once another input is
+    MIX_MAX_LAG_CHUNKS ahead, so one bad device never holds up the rest.
+    """
+
+    def __init__(self, count, sink, max_lag_chunks=MIX_MAX_LAG_CHUNKS):
+        self.pending = [deque() for _ in range(count)]
+        self.sink = sink
+        self.max_lag_chunks = max_lag_chunks
+        self.lock = threading.Lock()
+
+    def add(self, index, data):
+        with self.lock:
+            self.pending[index].append(data)
+            if not all(self.pending) and len(self.pending[index]) <= self.max_lag_chunks:
+                return
+            chunks = [p.popleft() for p in self.pending if p]
+            # Sink under the lock so mixed chunks keep their order
+            self.sink(mix_chunks(chunks))
+
+
+class AudioInput:
+    """One capture device: opens it, reads chunks into `sink` and fails over if it disappears."""
+
+    def __init__(self, streamer, config, sink):
+        self.streamer = streamer
+        self.config = config
+        self.sink = sink
+        self.stream = None
+        self.thread = None
+        # Latest input level (0-1), written by the capture thread and polled by the UI
+        self.level = 0.0
+        # Device currently being captured, and device switching state
+        self.active_device = None
+        self._device_change = threading.Event()
+        self._failed_device = None
+        # Input overflows reported by PortAudio (audio lost because we read too slowly)
+        self.overflows = 0
+
+    @property
+    def name(self):
+        return self.config.get('input_device_name', 'Default')
+
+    def start(self):
+        self._device_change.clear()
+        self._failed_device = None
+        self.thread = threading.Thread(target=self._stream_audio, daemon=True,
+                                       name=f"capture-{self.config['speaker']}")
+        self.thread.start()
+
+    def stop(self):
+        self._close_stream(None)
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=1)
+        self.level = 0.0
+
+    def _stream_audio(self):
+        """Stream audio from microphone, failing over if the device disappears."""
+        streamer = self.streamer
+        registry = get_registry()
+        registry.add_listener(self._on_devices_changed)
+        # Give the first enumeration a moment so devices can be matched by name
+        registry.wait_loaded(timeout=DEVICE_WAIT_SECONDS)
+
+        p = None
+        try:
+            while streamer.is_streaming:
+                device = self._pick_device(registry)
+                if device is None:
+                    # No fallback for this input: wait for the registry to see it again
+                    time.sleep(1)
+                    self._failed_device = None
+                    continue
+
+                p = pyaudio.PyAudio()
+                try:
+                    self.stream = p.open(
+                        format=streamer.format,
+                        channels=streamer.channels,
+                        rate=streamer.rate,
+                        input=True,
+                        input_device_index=device['index'],
+                        frames_per_buffer=streamer.chunk
+                    )
+                except Exception as e:
+                    print(f"Error opening audio device '{device['name']}': {e}")
+                    self._failed_device = device['name']
+                    self._close_stream(p)
+                    p = None
+                    time.sleep(1)
+                    registry.refresh_now()
+                    continue
+
+                self.active_device = device
+                print(f"Using audio device: {device['name']} ({self.config['speaker']})")
+                registry.hold()
+                try:
+                    self._read_stream()
+                finally:
+                    registry.release()
+
+                # Device failed or changed: reopen without stopping the stream threads
+                self._close_stream(p)
+                p = None
+                if streamer.is_streaming:
+                    # Rescan with every stream closed so PortAudio sees hot-plug changes
+                    registry.refresh_now()
+
+        except Exception as e:
+            print(f"Error in audio stream: {e}")
+        finally:
+            registry.remove_listener(self._on_devices_changed)
+            self._close_stream(p)
+            self.active_device = None
+
+    def _read_stream(self):
+        """Read chunks until streaming stops, the device fails or a device switch is requested."""
+        streamer = self.streamer
+        while streamer.is_streaming:
+            if self._device_change.is_set():
+                self._device_change.clear()
+                return
+            try:
+                if not streamer.is_paused:
+                    try:
+                        data = self.stream.read(streamer.chunk, exception_on_overflow=True)
+                    except IOError as e:
+                        if getattr(e, "errno", None) != pyaudio.paInputOverflowed:
+                            raise
+                        # Count the lost chunk and keep going, as the old silent read did
+                        self.overflows += 1
+                        continue
+                    self.sink(data)
+                    self.level = measure_level(data)
+                    self._failed_device = None
+                else:
+                    self.level = 0.0
+                    # Sleep briefly when paused to avoid busy waiting
+                    time.sleep(0.1)
+            except Exception as e:
+                if streamer.is_streaming:
+                    print(f"Error reading audio from '{self.active_device['name']}': {e}")
+                    self._failed_device = self.active_device['name']
+                    time.sleep(0.5)
+                return
+
+    def _close_stream(self, p):
+        stream, self.stream = self.stream, None
+        if stream:
+            try:
+                stream.stop_stream()
+                stream.close()
+            except:
+                pass
+        if p:
+            try:
+                p.terminate()
+            except:
+                pass
+
+    def _pick_device(self, registry):
+        """Configured input device if present, otherwise the fallback device (None if there is none)."""
+        name = self.name
+        fallback_name = self.config.get('fallback_input_device_name')
+
+        if name != self._failed_device:
+            if name == 'Default' or name is None:
+                return dict(DEFAULT_DEVICE)
+            # Match by name: indices shift when devices are plugged in or removed
+            device = registry.find(name)
+            if device:
+                return device
+            if not registry.loaded.is_set():
+                return {'index': self.config.get('input_device'), 'name': name}
+
+        if fallback_name is None:
+            return None
+        fallback = registry.find(fallback_name) if fallback_name != name else None
+        if not fallback or fallback['name'] == self._failed_device:
+            fallback = dict(DEFAULT_DEVICE)
+        print(f"Audio device '{name}' unavailable, falling back to '{fallback['name']}'")
+        return fallback
+
+    def _on_devices_changed(self, devices, added, removed):
+        """Registry listener: switch away from a removed device.
+
+        There is no switch back while a fallback stream is open, since PortAudio
+        can't see the configured device return until every stream is closed; it
+        is picked again the next time the input reopens.
+        """
+        active = self.active_device
+        if active and active['name'] in removed:
+            self._device_change.set()
+
+
+class Track:
+    """Audio buffer for one speaker, transcribed on its own thread.
+
+    Each track segments its audio (fixed windows, or speech/silence with VAD)
+    and runs recognition independently, so a slow transcription on one input
+    never delays the others.
+    """
+
+    def __init__(self, streamer, speaker, partials=False):
+        self.streamer = streamer
+        self.speaker = speaker
+        # Only the primary track feeds speculative generation, which follows one speaker
+        self.partials = partials
+        self.lock = threading.Lock()
+        self.thread = None
+        self.partial_thread = None
+        # Bounded so a stalled recognizer can't grow memory without limit
+        self.max_buffer_chunks = max(1, int(MAX_BUFFER_SECONDS * streamer.rate / streamer.chunk))
+        self.preroll_chunks = max(1, int(VAD_PREROLL_SECONDS * streamer.rate / streamer.chunk))
+        self.audio_data = self._new_buffer()
+        self.dropped_chunks = 0
+        # VAD state: when the current segment's speech started and was last heard
+        self.speech_started = None
+        self.last_voice = None
+
+    def _new_buffer(self):
+        return deque(maxlen=self.max_buffer_chunks)
+
+    def start(self):
+        with self.lock:
+            self.audio_data = self._new_buffer()
+            self.speech_started = None
+        self.thread = threading.Thread(target=self._process_audio, daemon=True, name=f"stt-{self.speaker}")
+        self.thread.start()
+
+    def stop(self):
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=1)
+
+    def feed(self, data):
+        """Append captured audio to the buffer for the next segment."""
+        voiced = VAD_THRESHOLD > 0 and measure_level(data) >= VAD_THRESHOLD
+        with self.lock:
+            if VAD_THRESHOLD > 0:
+                now = time.time()
+                if voiced:
+                    self.last_voice = now
+                    if self.speech_started is None:
+                        self.speech_started = now
+                elif self.speech_started is None:
+                    # No speech yet: keep only the pre-roll instead of transcribing silence
+                    while len(self.audio_data) >= self.preroll_chunks:
+                        self.audio_data.popleft()
+            if len(self.audio_data) == self.max_buffer_chunks:
+                self.dropped_chunks += 1
+            self.audio_data.append(data)
+
+    def _segment_ready(self, now, last_process_time):
+        if VAD_THRESHOLD <= 0:
+            return now - last_process_time >= AUDIO_PROCESS_SECONDS
+        with self.lock:
+            if self.speech_started is None:
+                return False
+            return (now - self.last_voice >= VAD_SILENCE_SECONDS
+                    or now - self.speech_started >= AUDIO_PROCESS_SECONDS)
+
+    def _partial_due(self, now, last_partial_time, last_process_time):
+        """Whether to transcribe the current segment so far for speculation.
+
+        The segment starts at the last processed window, or with VAD when speech
+        started (never during silence, which would only send the pre-roll).
+        """
+        if VAD_THRESHOLD > 0:
+            with self.lock:
+                segment_start = self.speech_started
+            if segment_start is None:
+                return False
+        else:
+            segment_start = last_process_time
+        return (now - max(last_partial_time, segment_start) >= SPECULATIVE_INTERVAL_SECONDS
+                # Not worth it when the final pass is about to run anyway
+                and AUDIO_PROCESS_SECONDS - (now - segment_start) > 1)
+
+    def _process_audio(self):
+        """Transcribe a segment whenever one is ready."""
+        streamer = self.streamer
+        last_process_time = time.time()
+        last_partial_time = last_process_time
+        # VAD needs to notice the end of speech promptly; fixed windows only need a coarse check
+        poll_seconds = 0.1 if VAD_THRESHOLD > 0 else 1
+
+        while streamer.is_streaming:
+            current_time = time.time()
+
+            if self._segment_ready(current_time, last_process_time):
+                self.convert_to_text()
+                last_process_time = current_time
+                last_partial_time = current_time
+            elif (self.partials and streamer.partial_callback
+                  and self._partial_due(current_time, last_partial_time, last_process_time)
+                  and not (self.partial_thread and self.partial_thread.is_alive())):
+                # Transcribe what we have so far on the side; the final pass still runs on schedule
+                last_partial_time = current_time
+                self.partial_thread = threading.Thread(target=self._transcribe_partial, daemon=True)
+                self.partial_thread.start()
+
+            time.sleep(poll_seconds)
+
+    def _transcribe_partial(self):
+        """Transcribe the audio captured so far without consuming it."""
+        streamer = self.streamer
+        with self.lock:
+            audio_frames = list(self.audio_data)
+        if not audio_frames:
+            return
+
+        try:
+            audio = sr.AudioData(b''.join(audio_frames), streamer.rate, pyaudio.get_sample_size(streamer.format))
+            text = streamer._recognize(audio, audio_frames, kind="stt_partial", speaker=self.speaker)
+        except sr.UnknownValueError:
+            return
+        except Exception as e:
+            print(f"Error in partial speech recognition: {e}")
+            return
+
+        if text and streamer.partial_callback:
+            streamer.partial_callback(text, speaker=self.speaker)
+
+    def convert_to_text(self):
+        """Convert accumulated audio data to text."""
+        # Each utterance gets its own trace, continued by text_callback
+        with trace():
+            self._convert_frames_to_text()
+
+    def _convert_frames_to_text(self):
+        streamer = self.streamer
+        try:
+            with self.lock:
+                if not self.audio_data:
+                    return
+
+                # Copy and clear audio data
+                audio_frames = list(self.audio_data)
+                self.audio_data = self._new_buffer()
+                self.speech_started = None
+
+            # Build the audio in memory; no temp file to leak if cleanup fails
+            with span("wav_build", chunks=len(audio_frames), speaker=self.speaker):
+                audio = sr.AudioData(b''.join(audio_frames), streamer.rate, pyaudio.get_sample_size(streamer.format))
+
+            # Convert to text using speech recognition
+            try:
+                with span("stt", speaker=self.speaker) as stt_span:
+                    text = streamer._recognize(audio, audio_frames, speaker=self.speaker)
+                    stt_span.set(chars=len(text))
+
+                print(f"{self.speaker}: {text}")
+
+                # Call callback if provided
+                if streamer.text_callback:
+                    streamer.text_callback(text, speaker=self.speaker)
+
+            except sr.UnknownValueError:
+                print("Could not understand audio")
+            except sr.RequestError as e:
+                print(f"Could not request results; {e}")
+            except Exception as e:
+                print(f"Error in speech recognition: {e}")
+
+        except Exception as e:
+            print(f"Error processing audio: {e}")
 
 
 class AudioStreamer:
-    def __init__(self, config, text_callback=None):
+    """Captures one or more inputs ("input_devices" in config.json) and transcribes them.
+
+    Each input gets its own capture thread and, unless the inputs are mixed
+    down ("mix_inputs"), its own Track with a speaker label, so co-hosts are
+    transcribed in parallel and attributed separately. text_callback and
+    partial_callback are called as callback(text, speaker=...).
+    """
+
+    def __init__(self, config, text_callback=None, partial_callback=None, frame_sink=None):
         self.config = config
         self.text_callback = text_callback
+        # When set, captured chunks go to frame_sink(data, track) instead of the
+        # tracks' buffers and no processing thread runs (capture-only, see process_runtime.py)
+        self.frame_sink = frame_sink
+        # Called with the transcript so far every SPECULATIVE_INTERVAL_SECONDS
+        self.partial_callback = partial_callback
         self.is_streaming = False
         self.is_paused = False
-        self.stream = None
-        self.audio_data = []
-        self.lock = threading.Lock()
-        self.stream_thread = None
-        self.process_thread = None
         self.recognizer = sr.Recognizer()
-        
+
         # Audio settings
         self.chunk = 1024
         self.format = pyaudio.paInt16
         self.channels = 1
         self.rate = 44100
-        
-    def start_streaming(self):
-        """Start audio streaming and processing."""
+
+        self.input_configs = input_configs(config)
+        # Several inputs become one feed when asked to
+        self.mixed = len(self.input_configs) > 1 and config.get("mix_inputs", False)
+        if self.mixed:
+            self.tracks = [Track(self, config.get("mix_speaker") or USERNAME, partials=True)]
+        else:
+            self.tracks = [Track(self, c["speaker"], partials=(i == 0)) for i, c in enumerate(self.input_configs)]
+        self.inputs = []
+
+    @property
+    def level(self):
+        """Loudest input level (0-1), polled by the UI."""
+        return max((i.level for i in self.inputs), default=0.0)
+
+    @property
+    def overflows(self):
+        return sum(i.overflows for i in self.inputs)
+
+    @property
+    def dropped_chunks(self):
+        return sum(t.dropped_chunks for t in self.tracks)
+
+    @property
+    def active_device(self):
+        return self.inputs[0].active_device if self.inputs else None
+
+    def _make_inputs(self):
+        if self.frame_sink:
+            sinks = [lambda data, i=i: self.frame_sink(data, i) for i in range(len(self.tracks))]
+        else:
+            sinks = [track.feed for track in self.tracks]
+        if self.mixed:
+            mixer = Mixer(len(self.input_configs), sinks[0])
+            return [AudioInput(self, c, lambda data, i=i: mixer.add(i, data))
+                    for i, c in enumerate(self.input_configs)]
+        return [AudioInput(self, c, sink) for c, sink in zip(self.input_configs, sinks)]
+
+    def start_streaming(self, capture=True):
+        """Start audio streaming and processing.
+
+        With capture=False only the processing threads run and audio is
+        supplied through feed().
+        """
         if self.is_streaming:
             return False
-            
+
         try:
             self.is_streaming = True
             self.is_paused = False
-            self.audio_data = []
-            
-            # Start streaming thread
-            self.stream_thread = threading.Thread(target=self._stream_audio, daemon=True)
-            self.stream_thread.start()
-            
-            # Start processing thread
-            self.process_thread = threading.Thread(target=self._process_audio, daemon=True)
-            self.process_thread.start()
-            
+
+            # Start one capture thread per input
+            if capture:
+                self.inputs = self._make_inputs()
+                for audio_input in self.inputs:
+                    audio_input.start()
+
+            # Start one processing thread per track
+            if not self.frame_sink:
+                for track in self.tracks:
+                    track.start()
+
             print("Audio streaming started")
             return True
-            
+
         except Exception as e:
             print(f"Error starting stream: {e}")
             self.is_streaming = False
             return False
-    
+
     def stop_streaming(self):
         """Stop audio streaming."""
         self.is_streaming = False
-        
-        if self.stream:
-            try:
-                self.stream.stop_stream()
-                self.stream.close()
-            except:
-                pass
-            self.stream = None
-            
+
         # Wait for threads to finish
-        if self.stream_thread and self.stream_thread.is_alive():
-            self.stream_thread.join(timeout=1)
-        if self.process_thread and self.process_thread.is_alive():
-            self.process_thread.join(timeout=1)
-            
+        for audio_input in self.inputs:
+            audio_input.stop()
+        for track in self.tracks:
+            track.stop()
+
         print("Audio streaming stopped")
-    
+
+    def stats(self):
+        """Capture counters for status display."""
+        return {"overflows": self.overflows, "dropped_bytes": self.dropped_chunks * self.chunk * 2}
+
     def pause_streaming(self):
         """Pause audio streaming."""
         if self.is_streaming:
             self.is_paused = True
             print("Audio streaming paused")
-    
+
     def resume_streaming(self):
         """Resume audio streaming."""
         if self.is_streaming:
             self.is_paused = False
             print("Audio streaming resumed")
-    
-    def _stream_audio(self):
-        """Stream audio from microphone."""
+
+    def feed(self, data, track=0):
+        """Append audio to a track's buffer (the first, or only, track by default)."""
+        self.tracks[track].feed(data)
+
+    def _recognize(self, audio, audio_frames, kind="stt", speaker=None):
+        """Run speech recognition, recording or replaying it through the cassette."""
+        cassette = get_cassette()
+        key = request_key(b''.join(audio_frames)) if cassette.mode != "off" else None
+        # Tag by speaker so tracks transcribed in parallel replay their own events
+        tagged = {"tag": speaker} if speaker is not None and len(self.tracks) > 1 else {}
+
+        if cassette.replaying:
+            event = cassette.replay(kind, key, tag=tagged.get("tag"))
+            if event.get("error") == "unknown":
+                raise sr.UnknownValueError()
+            if event.get("error") == "request":
+                raise sr.RequestError(event.get("message", ""))
+            return event["text"]
+
+        start = time.monotonic()
         try:
-            p = pyaudio.PyAudio()
-            
-            # Get device index from config
-            device_index = self.config.get('input_device')
-            
-            self.stream = p.open(
-                format=self.format,
-                channels=self.channels,
-                rate=self.rate,
-                input=True,
-                input_device_index=device_index,
-                frames_per_buffer=self.chunk
-            )
-            
-            print(f"Using audio device: {self.config.get('input_device_name', 'Default')}")
-            
-            while self.is_streaming:
-                try:
-                    if not self.is_paused:
-                        data = self.stream.read(self.chunk, exception_on_overflow=False)
-                        with self.lock:
-                            self.audio_data.append(data)
-                    else:
-                        # Sleep briefly when paused to avoid busy waiting
-                        time.sleep(0.1)
-                except Exception as e:
-                    print(f"Error reading audio: {e}")
-                    break
-                    
-        except Exception as e:
-            print(f"Error in audio stream: {e}")
-        finally:
-            if self.stream:
-                try:
-                    self.stream.stop_stream()
-                    self.stream.close()
-                except:
-                    pass
-            try:
-                p.terminate()
-            except:
-                pass
-    
-    def _process_audio(self):
-        """Process audio data every X seconds."""
-        last_process_time = time.time()
-        
-        while self.is_streaming:
-            current_time = time.time()
-            
-            # Process every X seconds
-            if current_time - last_process_time >= AUDIO_PROCESS_SECONDS:
-                self._convert_to_text()
-                last_process_time = current_time
-            
-            time.sleep(1)  # Check every second
-    
+            text = self.recognizer.recognize_google(audio)
+        except sr.UnknownValueError:
+            cassette.record(kind, key, {"error": "unknown", **tagged}, time.monotonic() - start)
+            raise
+        except sr.RequestError as e:
+            cassette.record(kind, key, {"error": "request", "message": str(e), **tagged}, time.monotonic() - start)
+            raise
+
+        payload = {"text": text, **tagged}
+        if speaker is not None:
+            payload["speaker"] = speaker
+        cassette.record(kind, key, payload, time.monotonic() - start)
+        return text
+
     def _convert_to_text(self):
-        """Convert accumulated audio data to text."""
-        try:
-            with self.lock:
-                if not self.audio_data:
-                    return
-                
-                # Copy and clear audio data
-                audio_frames = self.audio_data.copy()
-                self.audio_data = []
-            
-            # Create temporary wav file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                temp_filename = temp_file.name
-                
-                # Write audio data to wav file
-                wf = wave.open(temp_filename, 'wb')
-                wf.setnchannels(self.channels)
-                wf.setsampwidth(pyaudio.get_sample_size(self.format))
-                wf.setframerate(self.rate)
-                wf.writeframes(b''.join(audio_frames))
-                wf.close()
-                
-                # Convert to text using speech recognition
-                try:
-                    with sr.AudioFile(temp_filename) as source:
-                        audio = self.recognizer.record(source)
-                        text = self.recognizer.recognize_google(audio)
-                        
-                        print(f"{USERNAME}: {text}")
-                        
-                        # Call callback if provided
-                        if self.text_callback:
-                            self.text_callback(text)
-                            
-                except sr.UnknownValueError:
-                    print("Could not understand audio")
-                except sr.RequestError as e:
-                    print(f"Could not request results; {e}")
-                except Exception as e:
-                    print(f"Error in speech recognition: {e}")
-                
-                # Clean up temp file
-                try:
-                    os.unlink(temp_filename)
-                except:
-                    pass
-                    
-        except Exception as e:
-            print(f"Error processing audio: {e}")
\ No newline at end of file
+        """Transcribe whatever every track has buffered (used by the soak harness)."""
+        for track in self.tracks:
+            track.convert_to_text()
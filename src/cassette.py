@@ -0,0 +1,288 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+# off | record | replay
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").strip().lower()
+CASSETTE_FILE = os.getenv("CASSETTE_FILE", "cassette.jsonl.gz")
+# Replay at the recorded latency, or serve responses instantly
+CASSETTE_REPLAY_LATENCY = os.getenv("CASSETTE_REPLAY_LATENCY", "true").lower() == "true"
+RANDOM_SEED = os.getenv("RANDOM_SEED", "").strip()
+
+CASSETTE_VERSION = 1
+
+# Wall-clock times in prompts ([HH:MM:SS] memory entries) that differ on every run
+_TIMESTAMP = re.compile(r"\[\d{2}:\d{2}:\d{2}\]")
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when the cassette has no more events of a kind."""
+
+
+def request_key(payload):
+    """Stable short hash for a request payload (audio bytes or a JSON-able dict)."""
+    if isinstance(payload, (bytes, bytearray)):
+        data = bytes(payload)
+    else:
+        data = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+class Cassette:
+    """Records STT and LLM calls to a gzipped JSON-lines file, or serves them back.
+
+    Each line is one event: {"k": kind, "t": offset, "d": duration, "h": key, ...payload}.
+    The first line is a header holding the RNG seed so replays make the same choices.
+    Replay serves events of each kind in recorded order; the key is only checked so
+    a diverging replay is reported instead of silently serving the wrong response.
+    """
+
+    def __init__(self, path=CASSETTE_FILE, mode=CASSETTE_MODE, replay_latency=CASSETTE_REPLAY_LATENCY):
+        if mode not in ("off", "record", "replay"):
+            print(f"Unknown CASSETTE_MODE '{mode}', cassette disabled")
+            mode = "off"
+
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.seed = int(RANDOM_SEED) if RANDOM_SEED else None
+        self._file = None
+        self._events = defaultdict(deque)
+        self._mismatches = 0
+
+        if mode == "record":
+            if self.seed is None:
+                self.seed = random.SystemRandom().randrange(2 ** 32)
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            # Finish the gzip stream on a normal exit; see _load for sessions that crash
+            atexit.register(self.close)
+            self._write({"k": "meta", "version": CASSETTE_VERSION, "seed": self.seed})
+            print(f"Recording cassette to {path} (seed {self.seed})")
+        elif mode == "replay":
+            self._load()
+            print(f"Replaying cassette from {path} (seed {self.seed})")
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Line cut off by a crash
+                        continue
+                    if event.get("k") == "meta":
+                        self.seed = event.get("seed", self.seed)
+                    else:
+                        self._events[event["k"]].append(event)
+            except EOFError:
+                # Never closed (crash or forced exit): every flushed event before this is intact
+                print(f"Cassette {self.path} was not closed cleanly; replaying the events recorded before that")
+
+    def _write(self, event):
+        line = json.dumps(event, separators=(",", ":"))
+        with self.lock:
+            self._file.write(line + "\n")
+            # Sync-flush each event so a crashed session still leaves every event readable
+            self._file.flush()
+
+    def record(self, kind, key, payload, duration):
+        """Append one call to the cassette (no-op unless recording)."""
+        if not self.recording:
+            return
+        event = {
+            "k": kind,
+            "t": round(time.monotonic() - self.started, 4),
+            "d": round(duration, 4),
+            "h": key,
+        }
+        event.update(payload)
+        self._write(event)
+
+    def replay(self, kind, key=None, tag=None):
+        """Pop the next recorded event of a kind, sleeping for its latency if configured.
+
+        With a tag, the next event recorded with that tag is served instead, so
+        requests made concurrently (one per model tier) replay in a stable order.
+        """
+        with self.lock:
+            events = self._events[kind]
+            if not events:
+                raise CassetteMiss(f"No recorded '{kind}' events left in {self.path}")
+            event = None
+            if tag is not None:
+                for i, candidate in enumerate(events):
+                    if candidate.get("tag") == tag:
+                        event = candidate
+                        del events[i]
+                        break
+            if event is None:
+                event = events.popleft()
+            if key is not None and event.get("h") != key:
+                self._mismatches += 1
+                if self._mismatches == 1:
+                    print(f"Cassette replay diverged from recording at '{kind}' event t={event.get('t')}")
+
+        if self.replay_latency and event.get("d"):
+            time.sleep(event["d"])
+        return event
+
+    def close(self):
+        with self.lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """Shared cassette configured from the environment."""
+    global _cassette
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette()
+    return _cassette
+
+
+def configure_cassette(path=CASSETTE_FILE, mode=CASSETTE_MODE, replay_latency=CASSETTE_REPLAY_LATENCY):
+    """Replace the shared cassette, e.g. for the replay command."""
+    global _cassette
+    with _cassette_lock:
+        if _cassette:
+            _cassette.close()
+        _cassette = Cassette(path, mode, replay_latency)
+    return _cassette
+
+
+def close_cassette():
+    """Close the shared cassette if one was opened (finishes a recording)."""
+    with _cassette_lock:
+        if _cassette:
+            _cassette.close()
+
+
+def make_rng():
+    """RNG seeded from the cassette (replay), RANDOM_SEED, or the OS."""
+    return random.Random(get_cassette().seed)
+
+
+def _completion_from_event(event):
+    """Rebuild the parts of a chat completion response the app reads."""
+    usage = event.get("usage") or {}
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=event.get("content", "")))],
+        usage=SimpleNamespace(
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+        ),
+    )
+
+
+def _llm_request_key(kwargs):
+    """request_key for a chat completion, ignoring the timestamps in its messages."""
+    messages = [
+        {**message, "content": _TIMESTAMP.sub("[]", message.get("content", ""))}
+        for message in kwargs.get("messages", [])
+    ]
+    return request_key({**kwargs, "messages": messages})
+
+
+def chat_completion(get_client, cassette_tag=None, **kwargs):
+    """get_client().chat.completions.create() routed through the cassette.
+
+    The client is only built when the call isn't served from the cassette, so
+    replay needs no API key. cassette_tag labels the recorded event (e.g. the
+    model tier) for replay.
+    """
+    cassette = get_cassette()
+    key = _llm_request_key(kwargs) if cassette.mode != "off" else None
+    tagged = {"tag": cassette_tag} if cassette_tag is not None else {}
+
+    if cassette.replaying:
+        event = cassette.replay("llm", key, tag=cassette_tag)
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        return _completion_from_event(event)
+
+    start = time.monotonic()
+    try:
+        response = get_client().chat.completions.create(**kwargs)
+    except Exception as e:
+        cassette.record("llm", key, {"error": str(e), **tagged}, time.monotonic() - start)
+        raise
+
+    if cassette.recording:
+        usage = getattr(response, "usage", None)
+        cassette.record("llm", key, {
+            "content": response.choices[0].message.content,
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+                "completion_tokens": getattr(usage, "completion_tokens", 0),
+                "total_tokens": getattr(usage, "total_tokens", 0),
+            },
+            **tagged,
+        }, time.monotonic() - start)
+    return response
+
+
+def replay_session(text_callback, partial_callback=None):
+    """Feed recorded transcripts to text_callback at their recorded offsets.
+
+    With partial_callback, recorded partial transcripts are fed to it in the
+    same timeline, so speculative requests are made (and served) as recorded.
+    LLM calls made by the callbacks are served from the same cassette, so a
+    recorded session runs end to end without a microphone or network access.
+    """
+    cassette = get_cassette()
+    if not cassette.replaying:
+        raise RuntimeError("replay_session requires a cassette in replay mode")
+
+    kinds = ["stt", "stt_partial"] if partial_callback else ["stt"]
+    start = time.monotonic()
+    while True:
+        with cassette.lock:
+            queues = [cassette._events[kind] for kind in kinds if cassette._events[kind]]
+            if not queues:
+                break
+            # Next event in recorded order, whichever kind it is; "t" is when
+            # the transcript was ready (recorded after the call returned)
+            queue = min(queues, key=lambda q: q[0].get("t", 0))
+            event = queue.popleft()
+
+        if cassette.replay_latency:
+            wait = event.get("t", 0) - (time.monotonic() - start)
+            if wait > 0:
+                time.sleep(wait)
+
+        if not event.get("text"):
+            continue
+        if event["k"] == "stt_partial":
+            partial_callback(event["text"], speaker=event.get("speaker"))
+        else:
+            text_callback(event["text"], speaker=event.get("speaker"))
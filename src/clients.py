@@ -0,0 +1,34 @@
+import os
+import threading
+
+_openai_client = None
+_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Shared OpenAI client, built on first use.
+
+    openai/httpx are imported here rather than at module level so commands that
+    never call the API (config, --help) don't pay for loading them.
+    """
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                import certifi
+                import httpx
+                from openai import OpenAI
+
+                os.environ.pop("SSL_CERT_FILE", None)
+                _openai_client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=httpx.Client(verify=certifi.where()),
+                )
+    return _openai_client
+
+
+def set_openai_client(client):
+    """Override the shared client (e.g. with a stub for offline runs)."""
+    global _openai_client
+    with _lock:
+        _openai_client = client
@@ -0,0 +1,154 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+COALESCE_UTTERANCES = os.getenv("COALESCE_UTTERANCES", "false").lower() == "true"
+# Wait this long after an utterance for more speech before generating
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "0.5"))
+# Longest an utterance waits while more keeps arriving
+COALESCE_MAX_WAIT_SECONDS = float(os.getenv("COALESCE_MAX_WAIT_SECONDS", "3"))
+# New words arriving during a request that make its result stale (0 = never supersede)
+COALESCE_SUPERSEDE_WORDS = int(os.getenv("COALESCE_SUPERSEDE_WORDS", "12"))
+
+
+def _word_count(texts):
+    return sum(len(re.findall(r"\S+", text)) for text in texts)
+
+
+class Batch:
+    """Utterances merged into one generation request."""
+
+    def __init__(self, coalescer, parts, received_at):
+        self.coalescer = coalescer
+        # (text, speaker) per utterance, in the order spoken
+        self.parts = parts
+        # When the first of the utterances arrived (for latency)
+        self.received_at = received_at
+        self.superseded = False
+        self.committed = False
+        self.done = False
+
+    @property
+    def speakers(self):
+        return list(dict.fromkeys(speaker for _, speaker in self.parts))
+
+    @property
+    def speaker(self):
+        """The one speaker of every utterance, or None if several people spoke."""
+        speakers = self.speakers
+        return speakers[0] if len(speakers) == 1 else None
+
+    @property
+    def text(self):
+        """The utterances joined; labelled "speaker: text" when several people spoke."""
+        if self.speaker is not None:
+            return " ".join(text for text, _ in self.parts)
+        return "\n".join(f"{speaker}: {text}" for text, speaker in self.parts)
+
+    def commit(self):
+        """Claim the batch for posting; False if newer speech superseded it first."""
+        return self.coalescer._commit(self)
+
+
+class Coalescer:
+    """Merges utterances that arrive close together, or during a request, into one request.
+
+    submit() returns immediately. A worker thread waits COALESCE_WINDOW_SECONDS
+    after the latest utterance (COALESCE_MAX_WAIT_SECONDS at most) and calls
+    handle(batch) with everything pending; speech arriving while that runs is
+    held for the next batch. If COALESCE_SUPERSEDE_WORDS new words arrive
+    before the running batch commits (starts posting), its result is dropped
+    and its text is carried into the next batch instead.
+    """
+
+    def __init__(self, handle, window=COALESCE_WINDOW_SECONDS, max_wait=COALESCE_MAX_WAIT_SECONDS,
+                 supersede_words=COALESCE_SUPERSEDE_WORDS, clock=time.monotonic):
+        self.handle = handle
+        self.window = window
+        self.max_wait = max_wait
+        self.supersede_words = supersede_words
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.pending = []
+        self.carried = []
+        self.carried_at = None
+        self.in_flight = None
+        self.thread = None
+        # Room for a superseded request to finish alongside its replacement
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="generate")
+        self.metrics = {"utterances": 0, "requests": 0, "merged": 0, "superseded": 0}
+
+    def submit(self, text, speaker=None):
+        with self.cond:
+            self.pending.append((text, speaker, self.clock()))
+            self.metrics["utterances"] += 1
+            batch = self.in_flight
+            if (batch and self.supersede_words and not batch.committed and not batch.superseded
+                    and _word_count(t for t, _, _ in self.pending) >= self.supersede_words):
+                batch.superseded = True
+                self.carried = batch.parts + self.carried
+                self.carried_at = batch.received_at
+                self.metrics["superseded"] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True, name="coalescer")
+                self.thread.start()
+            self.cond.notify_all()
+
+    def _commit(self, batch):
+        with self.cond:
+            if batch.superseded:
+                return False
+            batch.committed = True
+            return True
+
+    def _next_batch(self):
+        with self.cond:
+            while not self.pending:
+                self.cond.wait()
+            # Debounce: wait for a pause in speech, but not forever
+            while True:
+                first = self.pending[0][2]
+                last = self.pending[-1][2]
+                remaining = min(last + self.window, first + self.max_wait) - self.clock()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            parts = self.carried + [(text, speaker) for text, speaker, _ in self.pending]
+            received_at = self.pending[0][2] if self.carried_at is None else self.carried_at
+            batch = Batch(self, parts, received_at)
+            if len(parts) > 1:
+                self.metrics["merged"] += len(parts) - 1
+            self.metrics["requests"] += 1
+            self.pending = []
+            self.carried = []
+            self.carried_at = None
+            self.in_flight = batch
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self.executor.submit(self._handle, batch)
+            with self.cond:
+                # A superseded request finishes in the background while the next one starts
+                while not batch.done and not batch.superseded:
+                    self.cond.wait()
+
+    def _handle(self, batch):
+        try:
+            self.handle(batch)
+        except Exception as e:
+            print(f"Error generating coalesced response: {e}")
+        finally:
+            with self.cond:
+                batch.done = True
+                if self.in_flight is batch:
+                    self.in_flight = None
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return dict(self.metrics)
@@ -0,0 +1,151 @@
+import os
+import threading
+
+from settings import get_audio_devices, test_audio_device
+
+# How often to re-enumerate input devices to notice hot-plugging (while no input is open)
+DEVICE_POLL_SECONDS = float(os.getenv("DEVICE_POLL_SECONDS", "5"))
+
+DEFAULT_DEVICE = {'index': None, 'name': 'Default', 'channels': 0}
+
+
+class DeviceRegistry:
+    """Cached list of audio input devices, kept current on a background thread.
+
+    PortAudio initialization is slow, so enumeration and device tests never run
+    on the caller's thread. Listeners are called from the registry thread as
+    callback(devices, added, removed) when the first enumeration finishes and
+    whenever the set of device names changes; UI code must marshal those calls
+    onto its own thread.
+
+    PortAudio only rescans hardware once every PyAudio instance is terminated,
+    so polling pauses while inputs are open (see hold/release): a poll would
+    only pay for PortAudio init and see the same list. Open inputs rescan
+    themselves after their stream fails.
+    """
+
+    def __init__(self, poll_interval=DEVICE_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self.devices = [dict(DEFAULT_DEVICE)]
+        self.loaded = threading.Event()
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.thread = None
+        self._holds = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start background enumeration (idempotent)."""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self._stop.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def hold(self):
+        """Pause polling while an input stream is open; pair with release()."""
+        with self.lock:
+            self._holds += 1
+
+    def release(self):
+        with self.lock:
+            self._holds -= 1
+
+    def _run(self):
+        requested = True
+        while not self._stop.is_set():
+            with self.lock:
+                held = self._holds > 0
+            # Explicit refresh() requests still enumerate
+            if requested or not held:
+                self.refresh_now()
+            requested = self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def refresh(self):
+        """Ask the background thread to re-enumerate now (non-blocking)."""
+        self.start()
+        self._wake.set()
+
+    def refresh_now(self):
+        """Re-enumerate on the calling thread and notify listeners of changes."""
+        devices = get_audio_devices()
+
+        with self.lock:
+            old_names = {d['name'] for d in self.devices}
+            new_names = {d['name'] for d in devices}
+            first = not self.loaded.is_set()
+            changed = first or old_names != new_names or devices != self.devices
+            self.devices = devices
+            listeners = list(self.listeners)
+        self.loaded.set()
+
+        if changed:
+            added = sorted(new_names - old_names)
+            removed = sorted(old_names - new_names)
+            if (added or removed) and not first:
+                print(f"Audio devices changed (added: {added or 'none'}, removed: {removed or 'none'})")
+            for callback in listeners:
+                try:
+                    callback(list(devices), added, removed)
+                except Exception as e:
+                    print(f"Error in device listener: {e}")
+        return devices
+
+    def get_devices(self):
+        """Cached devices; just the Default entry until the first enumeration finishes."""
+        with self.lock:
+            return list(self.devices)
+
+    def wait_loaded(self, timeout=None):
+        self.start()
+        return self.loaded.wait(timeout)
+
+    def find(self, name):
+        """Cached device with this name, or None."""
+        with self.lock:
+            for device in self.devices:
+                if device['name'] == name:
+                    return device
+        return None
+
+    def add_listener(self, callback):
+        with self.lock:
+            self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self.lock:
+            if callback in self.listeners:
+                self.listeners.remove(callback)
+
+    def test_device_async(self, device, callback):
+        """Test a device on a worker thread, then call callback(ok, message) from that thread."""
+        def run():
+            try:
+                ok, message = True, test_audio_device(device)
+            except Exception as e:
+                ok, message = False, f"Device test failed: {e}"
+            callback(ok, message)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Shared, started device registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DeviceRegistry()
+                _registry.start()
+    return _registry
@@ -2,13 +2,28 @@ import os
 import tkinter as tk
 import sys
 from tkinter import ttk, messagebox
-from settings import get_audio_devices, save_config, load_config
-import pyaudio
+from settings import save_config, load_config
+from device_registry import get_registry
 import pystray
 from PIL import Image
 import threading
+import queue
+from datetime import datetime
 from audio_streamer import AudioStreamer 
-from agent import on_text_received
+from process_runtime import RUNTIME_MODE, ProcessRuntime
+from tracing import close as close_traces
+from cassette import close_cassette
+from session_log import get_session_log
+import profiling
+from profiling import PROFILE_SECONDS
+from speculation import SPECULATIVE_GENERATION
+
+# Lines kept in the chat view; older lines are trimmed so memory stays constant
+CHAT_MAX_LINES = int(os.getenv("CHAT_MAX_LINES", "500"))
+# How often the Tk thread drains queued messages and refreshes the mic meter
+CHAT_REFRESH_MS = 100
+# Most messages inserted per refresh; a backlog beyond CHAT_MAX_LINES is dropped
+CHAT_BATCH_SIZE = 200
 
 
 
@@ -19,7 +34,11 @@ class SettingsWindow:
         self.config = config.copy()
         self.window = None
         self.device_var = None
+        self.device_combo = None
+        self.test_btn = None
         self.devices = []
+        # Results from registry threads, drained on the Tk thread
+        self.ui_queue = queue.Queue()
         
     def show(self):
         """Show the settings window."""
@@ -74,21 +93,20 @@ class SettingsWindow:
         
         ttk.Label(audio_frame, text="Input Device:").pack(anchor=tk.W, pady=(0, 5))
         
-        # Get available devices
-        self.devices = get_audio_devices()
+        # Cached devices; the registry enumerates in the background and
+        # reports changes through on_devices_changed
+        registry = get_registry()
+        self.devices = registry.get_devices()
         device_names = [f"{device['name']}" for device in self.devices]
         
         self.device_var = tk.StringVar()
-        device_combo = ttk.Combobox(audio_frame, textvariable=self.device_var, 
+        self.device_combo = ttk.Combobox(audio_frame, textvariable=self.device_var, 
                                    values=device_names, state="readonly", width=50)
-        device_combo.pack(fill=tk.X, pady=(0, 10))
+        self.device_combo.pack(fill=tk.X, pady=(0, 10))
         
-        # Set current selection
+        # Set current selection (kept even if the device list hasn't loaded yet)
         current_device_name = self.config.get('input_device_name', 'Default')
-        if current_device_name in device_names:
-            self.device_var.set(current_device_name)
-        else:
-            self.device_var.set('Default')
+        self.device_var.set(current_device_name or 'Default')
         
         # Refresh button
         refresh_btn = ttk.Button(audio_frame, text="Refresh Devices", 
@@ -96,9 +114,17 @@ class SettingsWindow:
         refresh_btn.pack(pady=(0, 10))
         
         # Test button
-        test_btn = ttk.Button(audio_frame, text="Test Selected Device", 
+        self.test_btn = ttk.Button(audio_frame, text="Test Selected Device", 
                              command=self.test_device)
-        test_btn.pack()
+        self.test_btn.pack()
+
+        registry.add_listener(self.on_devices_changed)
+        if registry.loaded.is_set():
+            # The first scan may have finished after the list above was read
+            self.update_device_list(registry.get_devices())
+        else:
+            registry.refresh()
+        self.window.after(200, self.poll_ui_queue)
         
         # Buttons frame
         button_frame = ttk.Frame(main_frame)
@@ -108,81 +134,77 @@ class SettingsWindow:
         ttk.Button(button_frame, text="Cancel", command=self.on_close).pack(side=tk.RIGHT, padx=(10, 0))
         ttk.Button(button_frame, text="Save", command=self.save_settings).pack(side=tk.RIGHT)
         
+    def on_devices_changed(self, devices, added, removed):
+        """Registry listener; runs on the registry thread."""
+        self.ui_queue.put(("devices", devices))
+
+    def poll_ui_queue(self):
+        """Apply device list updates and test results on the Tk thread."""
+        if not self.window:
+            return
+        try:
+            while True:
+                item = self.ui_queue.get_nowait()
+                if item[0] == "devices":
+                    self.update_device_list(item[1])
+                elif item[0] == "test":
+                    self.show_test_result(item[1], item[2])
+        except queue.Empty:
+            pass
+        self.window.after(200, self.poll_ui_queue)
+
+    def update_device_list(self, devices):
+        """Show a new device list, keeping the current selection if it still exists."""
+        self.devices = devices
+        device_names = [f"{device['name']}" for device in self.devices]
+        if self.device_combo:
+            self.device_combo['values'] = device_names
+        if self.device_var.get() not in device_names:
+            self.device_var.set('Default')
+
     def refresh_devices(self):
         """Refresh the list of available audio devices."""
         try:
-            self.devices = get_audio_devices()
-            device_names = [f"{device['name']}" for device in self.devices]
-            
-            # Update combobox
-            combo = None
-            for widget in self.window.winfo_children():
-                if isinstance(widget, ttk.Frame):
-                    for child in widget.winfo_children():
-                        if isinstance(child, ttk.LabelFrame):
-                            for grandchild in child.winfo_children():
-                                if isinstance(grandchild, ttk.Combobox):
-                                    combo = grandchild
-                                    break
-            
-            if combo:
-                combo['values'] = device_names
-                # Try to maintain current selection
-                current = self.device_var.get()
-                if current not in device_names:
-                    self.device_var.set('Default')
-                    
+            registry = get_registry()
+            # Push the cached list now; the registry reports any change when its rescan finishes
+            self.update_device_list(registry.get_devices())
+            registry.refresh()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to refresh devices: {e}")
     
     def test_device(self):
-        """Test the selected audio device."""
+        """Test the selected audio device without blocking the UI."""
         selected_name = self.device_var.get()
         
         if not selected_name:
             messagebox.showwarning("Warning", "Please select a device first.")
             return
             
-        try:
-            # Find the selected device
-            selected_device = None
-            for device in self.devices:
-                if device['name'] == selected_name:
-                    selected_device = device
-                    break
-            
-            if not selected_device:
-                messagebox.showerror("Error", "Selected device not found.")
-                return
-            
-            # Test the device (simple initialization test)
-            p = pyaudio.PyAudio()
-            
-            if selected_device['index'] is not None:
-                # Test specific device
-                stream = p.open(format=pyaudio.paInt16,
-                              channels=1,
-                              rate=44100,
-                              input=True,
-                              input_device_index=selected_device['index'],
-                              frames_per_buffer=1024)
-                stream.close()
-                message = f"Device '{selected_name}' is working correctly!"
-            else:
-                # Test default device
-                stream = p.open(format=pyaudio.paInt16,
-                              channels=1,
-                              rate=44100,
-                              input=True,
-                              frames_per_buffer=1024)
-                stream.close()
-                message = "Default device is working correctly!"
-            
-            p.terminate()
-            messagebox.showinfo("Success", message)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Device test failed: {e}")
+        # Find the selected device
+        selected_device = None
+        for device in self.devices:
+            if device['name'] == selected_name:
+                selected_device = device
+                break
+        
+        if not selected_device:
+            messagebox.showerror("Error", "Selected device not found.")
+            return
+
+        if self.test_btn:
+            self.test_btn.config(state=tk.DISABLED, text="Testing...")
+        get_registry().test_device_async(
+            selected_device,
+            lambda ok, message: self.ui_queue.put(("test", ok, message)),
+        )
+
+    def show_test_result(self, ok, message):
+        if self.test_btn:
+            self.test_btn.config(state=tk.NORMAL, text="Test Selected Device")
+        if ok:
+            messagebox.showinfo("Success", message, parent=self.window)
+        else:
+            messagebox.showerror("Error", message, parent=self.window)
     
     def save_settings(self):
         """Save the current settings."""
@@ -212,6 +234,7 @@ class SettingsWindow:
     
     def on_close(self):
         """Handle window close."""
+        get_registry().remove_listener(self.on_devices_changed)
         if self.window:
             self.window.grab_release()
             self.window.destroy()
@@ -219,7 +242,110 @@ class SettingsWindow:
 
 
 
-def create_tray_icon():
+class ChatPanel:
+    """Live chat view fed from a thread-safe queue.
+
+    post() may be called from any thread; only the Tk thread touches widgets,
+    draining the queue in batches on a root.after timer.
+    """
+
+    def __init__(self, parent, audio_streamer):
+        self.parent = parent
+        self.audio_streamer = audio_streamer
+        self.queue = queue.Queue()
+        self.line_count = 0
+
+        frame = ttk.Frame(parent)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+        meter_frame = ttk.Frame(frame)
+        meter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(meter_frame, text="Mic").pack(side="left", padx=(0, 5))
+        self.meter = ttk.Progressbar(meter_frame, orient=tk.HORIZONTAL, mode="determinate", maximum=100)
+        self.meter.pack(side="left", fill=tk.X, expand=True)
+        # Overflow/drop counters from the capture pipeline
+        self.status_var = tk.StringVar()
+        ttk.Label(meter_frame, textvariable=self.status_var, foreground="gray").pack(side="left", padx=(5, 0))
+
+        text_frame = ttk.Frame(frame)
+        text_frame.pack(fill=tk.BOTH, expand=True)
+        scrollbar = ttk.Scrollbar(text_frame)
+        scrollbar.pack(side="right", fill=tk.Y)
+        self.text = tk.Text(text_frame, height=12, width=48, wrap=tk.WORD, state=tk.DISABLED,
+                            yscrollcommand=scrollbar.set)
+        self.text.pack(side="left", fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.text.yview)
+        self.text.tag_configure("name", font=("Arial", 9, "bold"))
+        self.text.tag_configure("latency", foreground="gray")
+
+        self.parent.after(CHAT_REFRESH_MS, self._refresh)
+
+    def post(self, name, message, latency=None):
+        """Queue a message for display (thread-safe)."""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        # One line per message keeps the trim arithmetic exact
+        message = " ".join(message.splitlines())
+        self.queue.put((timestamp, name, message, latency))
+
+    def _take_batch(self):
+        batch = []
+        try:
+            # If we've fallen far behind, skip what would be trimmed straight away
+            while self.queue.qsize() > CHAT_MAX_LINES:
+                self.queue.get_nowait()
+            while len(batch) < CHAT_BATCH_SIZE:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _refresh(self):
+        try:
+            batch = self._take_batch()
+            if batch:
+                self._insert(batch)
+            self.meter["value"] = self.audio_streamer.level * 100
+            self._update_status()
+        except Exception as e:
+            print(f"Error updating chat view: {e}")
+        finally:
+            self.parent.after(CHAT_REFRESH_MS, self._refresh)
+
+    def _update_status(self):
+        stats = self.audio_streamer.stats()
+        parts = []
+        if stats.get("overflows"):
+            parts.append(f"{stats['overflows']} overflows")
+        if stats.get("dropped_bytes"):
+            parts.append(f"{stats['dropped_bytes'] // 2} samples dropped")
+        status = ", ".join(parts)
+        if self.status_var.get() != status:
+            self.status_var.set(status)
+
+    def _insert(self, batch):
+        at_bottom = self.text.yview()[1] >= 0.999
+        self.text.config(state=tk.NORMAL)
+
+        for timestamp, name, message, latency in batch:
+            self.text.insert(tk.END, f"[{timestamp}] ")
+            self.text.insert(tk.END, name, "name")
+            self.text.insert(tk.END, f": {message}")
+            if latency is not None:
+                self.text.insert(tk.END, f"  ({latency:.1f}s)", "latency")
+            self.text.insert(tk.END, "\n")
+        self.line_count += len(batch)
+
+        excess = self.line_count - CHAT_MAX_LINES
+        if excess > 0:
+            self.text.delete("1.0", f"{excess + 1}.0")
+            self.line_count -= excess
+
+        self.text.config(state=tk.DISABLED)
+        if at_bottom:
+            self.text.see(tk.END)
+
+
+def create_tray_icon(on_exit=None):
     icon_path = os.path.join(os.path.dirname(__file__), "../assets/icon.png")
     try:
         image = Image.open(icon_path)
@@ -229,18 +355,61 @@ def create_tray_icon():
 
     def on_quit(icon, item):
         icon.stop()
+        if on_exit:
+            # os._exit skips atexit, so finish logs and recordings first
+            on_exit()
         os._exit(0)  # Force quit to ensure tray closes
 
+    def run_in_background(action):
+        # Keep the tray responsive while files are written
+        def handler(icon, item):
+            def run():
+                try:
+                    action()
+                except Exception as e:
+                    print(f"Profiling error: {e}")
+            threading.Thread(target=run, daemon=True).start()
+        return handler
+
+    profiling_menu = pystray.Menu(
+        pystray.MenuItem(f"Sampling profile ({PROFILE_SECONDS:g}s)",
+                         run_in_background(lambda: profiling.start_profile("sampling"))),
+        pystray.MenuItem(f"Deterministic profile ({PROFILE_SECONDS:g}s)",
+                         run_in_background(lambda: profiling.start_profile("deterministic"))),
+        pystray.MenuItem("Stop profile now", run_in_background(profiling.stop_profile)),
+        pystray.MenuItem("Memory snapshot", run_in_background(profiling.memory_snapshot)),
+        pystray.MenuItem("Stop memory tracking", run_in_background(profiling.stop_memory_tracking)),
+        pystray.MenuItem("Dump thread stacks", run_in_background(profiling.dump_threads)),
+    )
+
     menu = pystray.Menu(
+        pystray.MenuItem("Profiling", profiling_menu),
         pystray.MenuItem("Quit", on_quit)
     )
     tray_icon = pystray.Icon("Fleetcast", image, "Fleetcast", menu)
 
     threading.Thread(target=tray_icon.run, daemon=True).start()
 
-def run_gui():
+def run_gui(multiprocess=None):
     # Load configuration
     config = load_config()
+    if multiprocess is None:
+        multiprocess = RUNTIME_MODE == "multiprocess"
+
+    agent = None
+    if not multiprocess:
+        # Imported here: in multiprocess mode the generation process owns the
+        # agent (RNG, executors, session log, cassette) and this one only renders
+        import agent
+
+        # Generate personas in the background so the first utterance never waits on it
+        agent.ensure_personas()
+
+    # Enumerate audio devices in the background so settings open instantly. In
+    # multiprocess mode no input is opened here, so nothing would pause the
+    # polling; the settings window starts the registry when it's first opened.
+    if not multiprocess:
+        get_registry()
     
     root = tk.Tk()
     root.title("Fleetcast")
@@ -273,7 +442,12 @@ def run_gui():
         start_img = pause_img = stop_img = settings_img = None
 
     
-    audio_streamer = AudioStreamer(config, text_callback=on_text_received)
+    if multiprocess:
+        # Capture, STT and generation run in worker processes; this one only renders
+        audio_streamer = ProcessRuntime(config, speculative=SPECULATIVE_GENERATION)
+    else:
+        audio_streamer = AudioStreamer(config, text_callback=agent.on_text_received,
+                                       partial_callback=agent.on_partial_text if agent.speculator else None)
     
     # Button functions
     streaming_state = {"started": False, "paused": False}
@@ -303,6 +477,9 @@ def run_gui():
             streaming_state["started"] = False
             streaming_state["paused"] = False
             print("Stopped streaming")
+            # In multiprocess mode the generation process prints its own as it exits
+            if agent:
+                agent.print_stats()
 
     # Create settings window handler
     settings_window = SettingsWindow(root, config)
@@ -315,6 +492,15 @@ def run_gui():
     ttk.Button(frame, image=stop_img, command=stop_streaming).pack(side="left", padx=5)
     ttk.Button(frame, image=settings_img, command=settings_window.show).pack(side="left", padx=5)
 
+    chat_panel = ChatPanel(root, audio_streamer)
+    if multiprocess:
+        audio_streamer.message_callback = chat_panel.post
+    else:
+        agent.add_message_listener(chat_panel.post)
+        # After the listener, so resumed responses show up in the chat view
+        agent.restore_session()
+        agent.warm_reactions()
+
     root.update_idletasks()
     width = root.winfo_width()
     height = root.winfo_height()
@@ -341,12 +527,24 @@ def run_gui():
 
     root.geometry(f"{width}x{height}+{x}+{y}")
 
+    def shutdown():
+        if agent:
+            # Unposted responses stay in the session log for the next start
+            agent.stop_posting.set()
+        audio_streamer.stop_streaming()
+        close_traces()
+        if agent:
+            get_session_log().close()
+            close_cassette()
+        profiling.shutdown()
+
     # Start tray icon in background
-    create_tray_icon()
+    create_tray_icon(on_exit=shutdown)
+    profiling.start_control_server()
 
     # Cleanup on window close
     def on_closing():
-        audio_streamer.stop_streaming()
+        shutdown()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
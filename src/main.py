@@ -1,12 +1,28 @@
 import argparse
 
-from gui import run_gui
-from settings import open_config
-from openai import OpenAI
-import certifi
-import ssl
-import httpx
-import os
+# Command modules are imported inside their branches: the GUI chain pulls in
+# tkinter, pystray, PIL, pyaudio and the OpenAI client, which `config` and
+# `--help` never need. benchmarks/startup.py keeps these paths within budget.
+
+def load_env():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+def replay(path, instant):
+    from cassette import CASSETTE_FILE, configure_cassette, replay_session
+
+    cassette = configure_cassette(path or CASSETTE_FILE, "replay", replay_latency=not instant)
+    from session_log import configure_session_log
+
+    # Keep the replayed session out of the live session log
+    configure_session_log(enabled=False)
+    import agent
+
+    # Reseed in case agent was imported before the cassette was switched to replay
+    agent.rng.seed(cassette.seed)
+    agent.speculation_rng.seed(cassette.seed)
+    replay_session(agent.on_text_received, agent.on_partial_text)
 
 def main():
 
@@ -15,15 +31,39 @@ def main():
 
 
 
-    subparsers.add_parser("run", help="Launch the GUI")
+    run_parser = subparsers.add_parser("run", help="Launch the GUI")
+    run_parser.add_argument("--multiprocess", action="store_true", default=None,
+                            help="Run capture, STT and generation in separate processes")
     subparsers.add_parser("config", help="Edit the config file")
 
-    args = parser.parse_args()
+    replay_parser = subparsers.add_parser("replay", help="Replay a recorded cassette without mic or network")
+    replay_parser.add_argument("cassette", nargs="?", default=None, help="Cassette file (default: CASSETTE_FILE)")
+    replay_parser.add_argument("--instant", action="store_true", help="Serve recorded calls without their latency")
+
+    # Options after `soak` are passed through to soak.py (see `fleetcast soak --help`)
+    subparsers.add_parser("soak", help="Run an accelerated soak test with stubbed STT/LLM", add_help=False)
+
+    args, extra = parser.parse_known_args()
+    if extra and args.command != "soak":
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
 
     if args.command == "run":
-        run_gui()
+        load_env()
+        from gui import run_gui
+
+        run_gui(multiprocess=args.multiprocess)
     elif args.command == "config":
+        from settings import open_config
+
         open_config()
+    elif args.command == "replay":
+        load_env()
+        replay(args.cassette, args.instant)
+    elif args.command == "soak":
+        load_env()
+        from soak import main as soak_main
+
+        raise SystemExit(soak_main(extra))
     else:
         parser.print_help()
 
@@ -1,23 +1,17 @@
 import os
 import json
 import random
-from openai import OpenAI
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-import certifi
-import ssl
-import httpx
+from cassette import chat_completion
+from clients import get_openai_client
+from routing import PERSONA_GENERATION_TIER, get_tier
 
 load_dotenv()
 
-# Initialize OpenAI client
-os.environ.pop("SSL_CERT_FILE", None)
-    
-client = OpenAI(
-api_key=os.getenv("OPENAI_API_KEY"),
-http_client=httpx.Client(
-    verify=certifi.where()
-))
-
 OPENAI_MODEL = os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo")
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "300"))
@@ -26,55 +20,267 @@ MIN_PERSONAS = int(os.getenv("MIN_GENERATED_PERSONAS", "1"))
 MAX_PERSONAS = int(os.getenv("MAX_GENERATED_PERSONAS", "2"))
 GENERATE_PERSONAS_IF_EMPTY = os.getenv("GENERATE_PERSONAS_IF_EMPTY", "true").lower() == "true"
 
+# Large requests are split into batches generated concurrently
+PERSONA_BATCH_SIZE = max(1, int(os.getenv("PERSONA_BATCH_SIZE", "10")))
+PERSONA_GENERATION_WORKERS = max(1, int(os.getenv("PERSONA_GENERATION_WORKERS", "4")))
+# Token allowance per persona; a batch gets max(MAX_TOKENS, batch size * this)
+PERSONA_TOKENS_PER_PERSONA = int(os.getenv("PERSONA_TOKENS_PER_PERSONA", "90"))
+# Descriptions sharing this fraction of their words count as duplicates
+PERSONA_SIMILARITY_THRESHOLD = float(os.getenv("PERSONA_SIMILARITY_THRESHOLD", "0.7"))
+# Extra rounds to make up for personas rejected as invalid or duplicate
+PERSONA_GENERATION_ROUNDS = int(os.getenv("PERSONA_GENERATION_ROUNDS", "3"))
 
-def generate_personas():
-    if not GENERATE_PERSONAS_IF_EMPTY:
-        print("Persona generation is disabled by environment settings.")
-        return {
-            "personas": []
+PERSONAS_FILE = "personas.json"
+
+FALLBACK_PERSONAS = {
+    "personas": [
+        {
+            "name": "Fallback",
+            "description": "Default fallback persona"
         }
+    ]
+}
+
+
+def validate_persona(persona):
+    """Return a cleaned copy of a persona in the shape create_persona_prompt expects, or None."""
+    if not isinstance(persona, dict):
+        return None
+
+    name = persona.get("name")
+    description = persona.get("description")
+    if not isinstance(name, str) or not name.strip():
+        return None
+    if not isinstance(description, str) or not description.strip():
+        return None
+
+    cleaned = {
+        "name": name.strip()[:40],
+        "description": description.strip(),
+    }
+
+    personality = persona.get("personality")
+    if isinstance(personality, str) and personality.strip():
+        cleaned["personality"] = personality.strip()
+
+    interests = persona.get("interests")
+    if isinstance(interests, str):
+        interests = interests.split(",")
+    if isinstance(interests, list):
+        interests = [i.strip() for i in interests if isinstance(i, str) and i.strip()]
+        if interests:
+            cleaned["interests"] = interests
+
+    return cleaned
+
+
+def _name_key(name):
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def _description_words(description):
+    return set(re.findall(r"[a-z0-9']+", description.lower()))
+
+
+def save_personas(personas_data, path=PERSONAS_FILE):
+    """Write personas atomically so readers never see a half-written file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".personas-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(personas_data, f, indent=4)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class PersonaCollection:
+    """Thread-safe set of personas with name and near-duplicate description checks."""
+
+    def __init__(self, personas=None, path=None):
+        self.personas = []
+        self.path = path
+        self.lock = threading.Lock()
+        self._names = set()
+        self._descriptions = []
+        for persona in personas or []:
+            self.add(persona)
+
+    def _is_duplicate(self, persona):
+        if _name_key(persona["name"]) in self._names:
+            return True
+        words = _description_words(persona["description"])
+        for other in self._descriptions:
+            union = words | other
+            if union and len(words & other) / len(union) >= PERSONA_SIMILARITY_THRESHOLD:
+                return True
+        return False
+
+    def add(self, persona):
+        """Validate and add a persona, returning False if it was rejected."""
+        persona = validate_persona(persona)
+        if persona is None:
+            return False
+        with self.lock:
+            if self._is_duplicate(persona):
+                return False
+            self.personas.append(persona)
+            self._names.add(_name_key(persona["name"]))
+            self._descriptions.append(_description_words(persona["description"]))
+            return True
+
+    def names(self):
+        with self.lock:
+            return [p["name"] for p in self.personas]
+
+    def save(self):
+        """Persist the current personas if this collection has a file."""
+        if not self.path:
+            return
+        with self.lock:
+            data = {"personas": list(self.personas)}
+            # Save under the lock so concurrent batches can't reorder writes
+            save_personas(data, self.path)
+
+    def to_dict(self):
+        with self.lock:
+            return {"personas": list(self.personas)}
 
-    count = random.randint(MIN_PERSONAS, MAX_PERSONAS)
 
-    system_prompt = f"""
-You are an assistant that generates fictional AI chatbot personas.
-Come up with a name and a personality description.
+def _build_prompt(count, avoid_names):
+    avoid = ""
+    if avoid_names:
+        # Only list a sample so the prompt stays small for large crowds
+        sample = avoid_names[-50:]
+        avoid = f"\nDo not reuse any of these names: {', '.join(sample)}\n"
+
+    return f"""
+You are an assistant that generates fictional AI chatbot personas for a live stream chat.
+Come up with a name, a description, a personality and a few interests for each.
 
 Respond ONLY in this exact JSON format (nothing else):
 {{
   "personas": [
     {{
       "name": "Name 1",
-      "description": "Description 1"
+      "description": "Description 1",
+      "personality": "Trait, trait, trait",
+      "interests": ["interest 1", "interest 2", "interest 3"]
     }},
     ...
   ]
 }}
 
-Generate {count} unique personas. Each name must be short (1-2 words). Each description must clearly express the persona's style or behavior.
+Generate {count} unique personas. Each name must be short (1-2 words) and look like a chat username. Each description must clearly express the persona's style or behavior. Make the personas varied.{avoid}
 """
 
-    try:
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt}
-            ],
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            response_format="json"
-        )
-
-        content = response.choices[0].message.content.strip()
-        return json.loads(content)
-
-    except Exception as e:
-        print(f"Error generating personas: {e}")
+
+def _generate_batch(count, avoid_names):
+    """Request one batch of personas from the API and return the raw list."""
+    model, temperature, max_tokens = OPENAI_MODEL, TEMPERATURE, MAX_TOKENS
+    if PERSONA_GENERATION_TIER:
+        _, tier = get_tier(PERSONA_GENERATION_TIER)
+        model, temperature, max_tokens = tier["model"], tier["temperature"], tier["max_tokens"]
+
+    response = chat_completion(
+        get_openai_client,
+        model=model,
+        messages=[
+            {"role": "system", "content": _build_prompt(count, avoid_names)}
+        ],
+        temperature=temperature,
+        max_tokens=max(max_tokens, count * PERSONA_TOKENS_PER_PERSONA),
+        response_format={"type": "json_object"}
+    )
+
+    content = response.choices[0].message.content.strip()
+    personas = json.loads(content).get("personas", [])
+    return personas if isinstance(personas, list) else []
+
+
+def generate_personas(rng=random, count=None, existing=None, path=None):
+    """Generate `count` new personas in concurrent batches.
+
+    Results are validated and deduplicated against each other and `existing`.
+    When `path` is given, the file is rewritten atomically after every batch so
+    the app can start using personas before generation has finished.
+    """
+    if not GENERATE_PERSONAS_IF_EMPTY:
+        print("Persona generation is disabled by environment settings.")
         return {
-            "personas": [
-                {
-                    "name": "Fallback",
-                    "description": "Default fallback persona"
-                }
-            ]
+            "personas": []
         }
+
+    if count is None:
+        count = rng.randint(MIN_PERSONAS, MAX_PERSONAS)
+
+    collection = PersonaCollection(existing, path=path)
+    target = len(collection.personas) + count
+
+    with ThreadPoolExecutor(max_workers=PERSONA_GENERATION_WORKERS) as executor:
+        for _ in range(PERSONA_GENERATION_ROUNDS):
+            remaining = target - len(collection.personas)
+            if remaining <= 0:
+                break
+
+            batches = [min(PERSONA_BATCH_SIZE, remaining - i) for i in range(0, remaining, PERSONA_BATCH_SIZE)]
+            futures = [executor.submit(_generate_batch, size, collection.names()) for size in batches]
+
+            for future in as_completed(futures):
+                try:
+                    personas = future.result()
+                except Exception as e:
+                    print(f"Error generating personas: {e}")
+                    continue
+
+                added = 0
+                for persona in personas:
+                    if len(collection.personas) >= target:
+                        break
+                    if collection.add(persona):
+                        added += 1
+
+                if added:
+                    try:
+                        collection.save()
+                    except Exception as e:
+                        print(f"Error saving personas: {e}")
+
+    result = collection.to_dict()
+    if not result["personas"]:
+        return FALLBACK_PERSONAS
+    print(f"Generated {len(result['personas'])} personas")
+    return result
+
+
+_background_thread = None
+_background_lock = threading.Lock()
+
+
+def start_background_generation(path=PERSONAS_FILE, rng=random, count=None):
+    """Generate personas into `path` on a daemon thread (at most one at a time)."""
+    global _background_thread
+    with _background_lock:
+        if _background_thread and _background_thread.is_alive():
+            return _background_thread
+
+        def run():
+            result = generate_personas(rng=rng, count=count, path=path)
+            if result is FALLBACK_PERSONAS:
+                try:
+                    save_personas(result, path)
+                except Exception as e:
+                    print(f"Error saving personas: {e}")
+
+        _background_thread = threading.Thread(target=run, daemon=True)
+        _background_thread.start()
+        return _background_thread
+
+
+def is_generating():
+    """Whether background persona generation is still running."""
+    return bool(_background_thread and _background_thread.is_alive())
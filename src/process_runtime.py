@@ -0,0 +1,354 @@
+import multiprocessing as mp
+import os
+import queue
+import signal
+import struct
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+# thread (default): everything in one process; multiprocess: capture, STT and
+# generation each get their own process and the GUI process only renders
+RUNTIME_MODE = os.getenv("RUNTIME_MODE", "thread").strip().lower()
+# Audio the shared ring holds before unread audio is overwritten (counted as dropped)
+AUDIO_RING_SECONDS = float(os.getenv("AUDIO_RING_SECONDS", "60"))
+# How often workers report their counters to the GUI process
+STATUS_INTERVAL_SECONDS = 2.0
+# How long stop waits for a worker to finish (an LLM request, a post) before terminating it
+WORKER_STOP_SECONDS = 10
+
+SAMPLE_RATE = 44100
+SAMPLE_WIDTH = 2
+
+# write_pos, overflows, level: single writer (capture process), read by everyone
+_HEADER = struct.Struct("QQd")
+
+
+class AudioRing:
+    """Single-writer byte ring in shared memory.
+
+    The writer copies audio in and then publishes the new total write position;
+    a reader keeps its own read position and, if it falls more than a ring
+    behind, skips ahead and reports the skipped bytes as dropped.
+    """
+
+    def __init__(self, name=None, capacity=None):
+        if name is None:
+            self.capacity = int(capacity)
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADER.size + self.capacity)
+            self.owner = True
+            _HEADER.pack_into(self.shm.buf, 0, 0, 0, 0.0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.capacity = self.shm.size - _HEADER.size
+            self.owner = False
+        self.name = self.shm.name
+        self.data = self.shm.buf[_HEADER.size:_HEADER.size + self.capacity]
+
+    @classmethod
+    def for_seconds(cls, seconds=AUDIO_RING_SECONDS):
+        return cls(capacity=int(seconds * SAMPLE_RATE * SAMPLE_WIDTH))
+
+    def _header(self):
+        return _HEADER.unpack_from(self.shm.buf, 0)
+
+    @property
+    def write_pos(self):
+        return self._header()[0]
+
+    @property
+    def overflows(self):
+        return self._header()[1]
+
+    @property
+    def level(self):
+        return self._header()[2]
+
+    def write(self, data, level=None, overflows=None):
+        """Append bytes (writer only) and publish the new position and counters."""
+        write_pos, old_overflows, old_level = self._header()
+        data = memoryview(data)[-self.capacity:]
+        start = write_pos % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.data[start:start + first] = data[:first]
+        if first < len(data):
+            self.data[:len(data) - first] = data[first:]
+        _HEADER.pack_into(
+            self.shm.buf, 0,
+            write_pos + len(data),
+            old_overflows if overflows is None else overflows,
+            old_level if level is None else level,
+        )
+
+    def read(self, read_pos):
+        """Return (data, new_read_pos, dropped_bytes) for everything written since read_pos."""
+        write_pos = self.write_pos
+        available = write_pos - read_pos
+        dropped = 0
+        if available > self.capacity:
+            dropped = available - self.capacity
+            read_pos = write_pos - self.capacity
+            available = self.capacity
+        if available <= 0:
+            return b"", read_pos, 0
+
+        start = read_pos % self.capacity
+        first = min(available, self.capacity - start)
+        data = bytes(self.data[start:start + first])
+        if first < available:
+            data += bytes(self.data[:available - first])
+        return data, write_pos, dropped
+
+    def close(self):
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _queue_size(q):
+    try:
+        return q.qsize()
+    except NotImplementedError:  # macOS
+        return 0
+
+
+def _ring_count(config):
+    """Rings needed for a config: one per input, unless the inputs are mixed down."""
+    inputs = config.get("input_devices") or [None]
+    return 1 if config.get("mix_inputs") else len(inputs)
+
+
+def _capture_main(ring_names, config, stop_event, pause_event, status_queue):
+    """Capture process: microphones -> one shared ring per input (or per mixdown)."""
+    from audio_streamer import AudioStreamer
+
+    rings = [AudioRing(name) for name in ring_names]
+    streamer = None
+
+    def sink(data, track):
+        if not stop_event.is_set():
+            rings[track].write(data, level=streamer.level, overflows=streamer.overflows)
+
+    streamer = AudioStreamer(config, frame_sink=sink)
+    streamer.start_streaming()
+    try:
+        while not stop_event.is_set():
+            if pause_event.is_set() and not streamer.is_paused:
+                streamer.pause_streaming()
+            elif not pause_event.is_set() and streamer.is_paused:
+                streamer.resume_streaming()
+            status_queue.put(("status", "capture", {"overflows": streamer.overflows}))
+            stop_event.wait(STATUS_INTERVAL_SECONDS)
+    finally:
+        streamer.stop_streaming()
+        for ring in rings:
+            ring.close()
+
+
+def _stt_main(ring_names, config, stop_event, text_queue, status_queue, speculative):
+    """STT process: shared rings -> transcripts on text_queue, one track per ring."""
+    from audio_streamer import AudioStreamer
+    from cassette import CASSETTE_MODE, configure_cassette
+
+    if CASSETTE_MODE == "record":
+        # The generation process records the transcripts; one writer per cassette file
+        configure_cassette(mode="off")
+
+    rings = [AudioRing(name) for name in ring_names]
+    streamer = AudioStreamer(
+        config,
+        text_callback=lambda text, speaker=None: text_queue.put(("final", text, speaker)),
+        partial_callback=(lambda text, speaker=None: text_queue.put(("partial", text, speaker)))
+        if speculative else None,
+    )
+    streamer.start_streaming(capture=False)
+
+    # Start from whatever is being written now, not from stale audio
+    read_positions = [ring.write_pos for ring in rings]
+    dropped = 0
+    last_status = 0.0
+    try:
+        while not stop_event.is_set():
+            for track, ring in enumerate(rings):
+                data, read_positions[track], skipped = ring.read(read_positions[track])
+                if data:
+                    streamer.feed(data, track=track)
+                dropped += skipped
+            if time.monotonic() - last_status >= STATUS_INTERVAL_SECONDS:
+                last_status = time.monotonic()
+                status_queue.put(("status", "stt", {"dropped_bytes": dropped}))
+            stop_event.wait(0.05)
+    finally:
+        streamer.stop_streaming()
+        for ring in rings:
+            ring.close()
+
+
+def _generation_main(stop_event, text_queue, status_queue):
+    """Generation process: transcripts -> LLM -> chat messages on status_queue."""
+    import agent
+    from cassette import get_cassette
+    from routing import tier_stats
+    from session_log import get_session_log
+
+    # The only process that writes the cassette in record mode: LLM calls, plus
+    # the transcripts as they arrive here, so `fleetcast replay` can feed them back
+    cassette = get_cassette()
+
+    agent.add_message_listener(
+        lambda name, message, latency: status_queue.put(("message", name, message, latency))
+    )
+    agent.ensure_personas()
+    agent.restore_session()
+    agent.warm_reactions()
+
+    def stop_posting():
+        # Posting blocks the loop for seconds per message; stop between messages
+        stop_event.wait()
+        agent.stop_posting.set()
+
+    threading.Thread(target=stop_posting, daemon=True, name="stop-watcher").start()
+    # If stop still times out, terminate() (SIGTERM on POSIX) runs the cleanup below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    handled = 0
+    try:
+        while not stop_event.is_set():
+            try:
+                kind, text, speaker = text_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if cassette.recording:
+                payload = {"text": text} if speaker is None else {"text": text, "speaker": speaker}
+                cassette.record("stt_partial" if kind == "partial" else "stt", None, payload, 0.0)
+            if kind == "partial":
+                agent.on_partial_text(text, speaker=speaker)
+            else:
+                agent.on_text_received(text, speaker=speaker)
+                handled += 1
+                status_queue.put(("status", "generation", {
+                    "utterances": handled,
+                    "backlog": _queue_size(text_queue),
+                    "tiers": tier_stats.snapshot(),
+                }))
+    finally:
+        agent.print_stats()
+        get_session_log().close()
+        cassette.close()
+
+
+class ProcessRuntime:
+    """Runs capture, STT and generation in separate processes.
+
+    Exposes the same start/pause/resume/stop interface and `level` attribute as
+    AudioStreamer, so the GUI can use either. Chat messages and worker counters
+    come back on one status queue, drained here on a background thread.
+    """
+
+    def __init__(self, config, message_callback=None, speculative=False):
+        self.config = config
+        self.message_callback = message_callback
+        self.speculative = speculative
+        self.ctx = mp.get_context("spawn")
+        # One ring per input, so the STT process keeps each speaker on its own track
+        self.rings = []
+        self.processes = []
+        self.stop_event = None
+        self.pause_event = None
+        self.status_queue = None
+        self.text_queue = None
+        self.status_thread = None
+        self.is_streaming = False
+        self.status = {}
+
+    @property
+    def level(self):
+        return max((ring.level for ring in self.rings), default=0.0)
+
+    def start_streaming(self):
+        if self.is_streaming:
+            return False
+        try:
+            self.rings = [AudioRing.for_seconds() for _ in range(_ring_count(self.config))]
+            ring_names = [ring.name for ring in self.rings]
+            self.stop_event = self.ctx.Event()
+            self.pause_event = self.ctx.Event()
+            self.status_queue = self.ctx.Queue()
+            self.text_queue = self.ctx.Queue()
+
+            self.processes = [
+                self.ctx.Process(target=_capture_main, name="fleetcast-capture", daemon=True,
+                                 args=(ring_names, self.config, self.stop_event, self.pause_event,
+                                       self.status_queue)),
+                self.ctx.Process(target=_stt_main, name="fleetcast-stt", daemon=True,
+                                 args=(ring_names, self.config, self.stop_event, self.text_queue,
+                                       self.status_queue, self.speculative)),
+                self.ctx.Process(target=_generation_main, name="fleetcast-generation", daemon=True,
+                                 args=(self.stop_event, self.text_queue, self.status_queue)),
+            ]
+            for process in self.processes:
+                process.start()
+
+            self.is_streaming = True
+            self.status_thread = threading.Thread(target=self._drain_status, daemon=True)
+            self.status_thread.start()
+            print("Audio streaming started (multiprocess)")
+            return True
+        except Exception as e:
+            print(f"Error starting multiprocess runtime: {e}")
+            self.stop_streaming()
+            return False
+
+    def _drain_status(self):
+        while self.is_streaming:
+            try:
+                item = self.status_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if item[0] == "message" and self.message_callback:
+                self.message_callback(*item[1:])
+            elif item[0] == "status":
+                _, worker, counters = item
+                self.status[worker] = counters
+
+    def pause_streaming(self):
+        if self.is_streaming:
+            self.pause_event.set()
+            print("Audio streaming paused")
+
+    def resume_streaming(self):
+        if self.is_streaming:
+            self.pause_event.clear()
+            print("Audio streaming resumed")
+
+    def stop_streaming(self):
+        self.is_streaming = False
+        if self.stop_event:
+            self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=WORKER_STOP_SECONDS)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        if self.status_thread and self.status_thread.is_alive():
+            self.status_thread.join(timeout=1)
+        if self.status:
+            print(f"Runtime status: {self.stats()}")
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
+        print("Audio streaming stopped")
+
+    def stats(self):
+        """Latest counters from each worker process."""
+        stats = {}
+        for counters in list(self.status.values()):
+            stats.update(counters)
+        return stats
@@ -0,0 +1,314 @@
+"""On-demand profiling of the running app.
+
+Everything here is idle until asked for: no profiler, sampler or tracemalloc
+runs until a tray menu item or the local control endpoint starts one.
+
+The endpoint is off unless PROFILING_PORT is set. It only accepts POST with
+the token printed at startup, so a web page can't trigger it:
+
+    curl -X POST -H "X-Profiling-Token: <token>" "http://127.0.0.1:8765/profile/start?mode=sampling&seconds=30"
+    curl -X POST -H "X-Profiling-Token: <token>" http://127.0.0.1:8765/profile/stop
+    curl -X POST -H "X-Profiling-Token: <token>" http://127.0.0.1:8765/memory/snapshot
+    curl -X POST -H "X-Profiling-Token: <token>" http://127.0.0.1:8765/memory/stop
+    curl -X POST -H "X-Profiling-Token: <token>" http://127.0.0.1:8765/threads
+
+Results are written to timestamped files in PROFILE_DIR. In multiprocess
+mode this covers the GUI process; the worker processes are not profiled.
+"""
+import hmac
+import io
+import json
+import os
+import secrets
+import sys
+import threading
+import traceback
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Local control endpoint (127.0.0.1 only); 0 disables it
+PROFILING_PORT = int(os.getenv("PROFILING_PORT", "0"))
+# Default profile length, and the sampling profiler's interval
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+# Frames kept per allocation by tracemalloc
+TRACEMALLOC_FRAMES = 25
+
+
+def _output_path(kind, ext):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    now = datetime.now()
+    return os.path.join(PROFILE_DIR, f"{kind}-{now:%Y%m%d-%H%M%S}-{now.microsecond // 1000:03d}.{ext}")
+
+
+def _thread_names():
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+class _SamplingProfile:
+    """Samples every thread's stack and writes collapsed stacks (flamegraph.pl / speedscope format)."""
+
+    kind = "sampling"
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self.count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profile-sampler")
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = _thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.count += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        path = _output_path("sampling", "folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Sampling profile: {self.count} samples written to {path}")
+        return [path]
+
+
+class _DeterministicProfile:
+    """Rough cProfile of every thread (Python 3.12+, where cProfile hooks all threads at once).
+
+    cProfile keeps a single call stack for the whole interpreter, so threads
+    running at the same time mix up each other's timings. Call counts are
+    reliable; for per-thread timing use the sampling profile.
+    """
+
+    kind = "deterministic"
+
+    def __init__(self):
+        if sys.version_info < (3, 12):
+            # Before 3.12 cProfile only sees the thread that enabled it
+            raise RuntimeError("Deterministic profiling of all threads needs Python 3.12+; use sampling")
+        import cProfile
+
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        import pstats
+
+        self.profiler.disable()
+        path = _output_path("cprofile", "prof")
+        self.profiler.dump_stats(path)
+        summary = io.StringIO()
+        summary.write("Rough profile: threads running at the same time share one cProfile call stack,\n"
+                      "so their timings are mixed. Use the sampling profile for per-thread timing.\n\n")
+        pstats.Stats(self.profiler, stream=summary).sort_stats("cumulative").print_stats(60)
+        text_path = path[:-len(".prof")] + ".txt"
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        print(f"Deterministic profile (rough with several threads) written to {path}")
+        return [path, text_path]
+
+
+_lock = threading.Lock()
+_active = None
+_timer = None
+_last_snapshot = None
+
+
+def start_profile(mode="sampling", seconds=PROFILE_SECONDS):
+    """Start a profile that stops itself after `seconds`; raises RuntimeError if one is running."""
+    global _active, _timer
+    with _lock:
+        if _active:
+            raise RuntimeError(f"A {_active.kind} profile is already running")
+        if mode == "sampling":
+            profile = _SamplingProfile(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        elif mode == "deterministic":
+            profile = _DeterministicProfile()
+        else:
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        profile.start()
+        _active = profile
+        _timer = threading.Timer(seconds, stop_profile)
+        _timer.daemon = True
+        _timer.start()
+    print(f"Started {mode} profile for {seconds:g}s")
+    return {"mode": mode, "seconds": seconds}
+
+
+def stop_profile():
+    """Stop the running profile and write its files; returns their paths ([] if none was running)."""
+    global _active, _timer
+    with _lock:
+        profile, _active = _active, None
+        if _timer:
+            _timer.cancel()
+            _timer = None
+    return profile.stop() if profile else []
+
+
+def profile_status():
+    with _lock:
+        return {"profile": _active.kind if _active else None}
+
+
+def memory_snapshot():
+    """Take a tracemalloc snapshot, plus a diff against the previous one.
+
+    The first call starts tracemalloc (which slows allocation until
+    stop_memory_tracking), so that snapshot is the baseline.
+    """
+    global _last_snapshot
+    import tracemalloc
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _last_snapshot = None
+        print("tracemalloc started; take another snapshot later to see growth")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    path = _output_path("tracemalloc", "snap")
+    snapshot.dump(path)
+
+    current, peak = tracemalloc.get_traced_memory()
+    text_path = path[:-len(".snap")] + ".txt"
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(f"Traced memory: {current / 1024:.0f} KB (peak {peak / 1024:.0f} KB)\n\nTop allocations:\n")
+        for stat in snapshot.statistics("lineno")[:50]:
+            f.write(f"{stat}\n")
+        if _last_snapshot is not None:
+            f.write("\nGrowth since previous snapshot:\n")
+            for stat in snapshot.compare_to(_last_snapshot, "lineno")[:50]:
+                f.write(f"{stat}\n")
+    _last_snapshot = snapshot
+    print(f"Memory snapshot written to {text_path}")
+    return [path, text_path]
+
+
+def stop_memory_tracking():
+    """Stop tracemalloc so allocations are full speed again."""
+    global _last_snapshot
+    import tracemalloc
+
+    _last_snapshot = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        print("tracemalloc stopped")
+        return True
+    return False
+
+
+def dump_threads():
+    """Write the current stack of every thread (audio, processing, tray, Tk...)."""
+    names = _thread_names()
+    path = _output_path("threads", "txt")
+    with open(path, "w", encoding="utf-8") as f:
+        for ident, frame in sys._current_frames().items():
+            f.write(f"Thread {names.get(ident, '?')} ({ident}):\n")
+            f.write("".join(traceback.format_stack(frame)))
+            f.write("\n")
+    print(f"Thread stacks written to {path}")
+    return [path]
+
+
+class _ControlHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # GET is reachable from any web page (e.g. an <img> tag), so it does nothing
+        self._reply(405, {"error": "Use POST with the X-Profiling-Token header"})
+
+    def do_POST(self):
+        token = self.headers.get("X-Profiling-Token", "")
+        if not _token or not hmac.compare_digest(token, _token):
+            self._reply(403, {"error": "Missing or wrong X-Profiling-Token"})
+            return
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/profile/start":
+                result = start_profile(query.get("mode", "sampling"),
+                                       float(query.get("seconds", PROFILE_SECONDS)))
+            elif url.path == "/profile/stop":
+                result = {"files": stop_profile()}
+            elif url.path == "/memory/snapshot":
+                result = {"files": memory_snapshot()}
+            elif url.path == "/memory/stop":
+                result = {"stopped": stop_memory_tracking()}
+            elif url.path == "/threads":
+                result = {"files": dump_threads()}
+            elif url.path == "/":
+                result = profile_status()
+            else:
+                self._reply(404, {"error": f"Unknown path {url.path}"})
+                return
+        except (RuntimeError, ValueError) as e:
+            self._reply(409, {"error": str(e)})
+            return
+        self._reply(200, result)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+# Per-run secret required by the endpoint
+_token = None
+
+
+def start_control_server(port=PROFILING_PORT):
+    """Serve the profiling endpoint on 127.0.0.1 in a daemon thread (no-op if port is 0)."""
+    global _server, _token
+    if not port or _server:
+        return _server
+    _token = secrets.token_urlsafe(16)
+    try:
+        _server = ThreadingHTTPServer(("127.0.0.1", port), _ControlHandler)
+    except OSError as e:
+        print(f"Profiling endpoint unavailable on port {port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True, name="profiling-endpoint").start()
+    print(f"Profiling endpoint on http://127.0.0.1:{port}/ (POST with header X-Profiling-Token: {_token})")
+    return _server
+
+
+def shutdown():
+    """Write out a profile still running at exit and stop the endpoint."""
+    global _server
+    try:
+        stop_profile()
+    except Exception as e:
+        print(f"Error writing profile: {e}")
+    if _server:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from collections import deque
+
+# Target chat volume; 0 keeps DECISION_CHANCE/SELECTION_CHANCE fixed
+TARGET_MESSAGES_PER_MINUTE = float(os.getenv("TARGET_MESSAGES_PER_MINUTE", "0"))
+# API budget per minute; 0 means unlimited
+MAX_TOKENS_PER_MINUTE = int(os.getenv("MAX_TOKENS_PER_MINUTE", "0"))
+MAX_REQUESTS_PER_MINUTE = int(os.getenv("MAX_REQUESTS_PER_MINUTE", "0"))
+# Sliding window the rates are measured over
+RATE_WINDOW_SECONDS = float(os.getenv("RATE_WINDOW_SECONDS", "60"))
+# Initial pause after the API reports rate limiting; doubles on repeats
+RATE_BACKOFF_SECONDS = float(os.getenv("RATE_BACKOFF_SECONDS", "15"))
+
+MAX_BACKOFF_SECONDS = 300
+# Don't adjust until this much of the window has been observed
+WARMUP_SECONDS = 15
+# Minimum time between gain adjustments
+UPDATE_INTERVAL_SECONDS = 5
+# Fraction of the token/request budget at which chat starts to thin out
+PRESSURE_THRESHOLD = 0.8
+MIN_GAIN = 0.01
+MAX_GAIN = 50.0
+
+
+def is_rate_limit_error(error):
+    """Whether an API exception means we are being rate limited (429)."""
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+class RateController:
+    """Feedback controller for chat volume and API spend.
+
+    Measures posted messages, requests and tokens over a sliding window and
+    scales the decision/selection probabilities so output converges on the
+    target messages per minute. When the token or request budget is nearly
+    used up, or the API returns 429, it lowers the odds or skips requests
+    outright instead of letting them queue.
+    """
+
+    def __init__(self, decision_chance, selection_chance,
+                 target_mpm=TARGET_MESSAGES_PER_MINUTE,
+                 max_tokens_per_minute=MAX_TOKENS_PER_MINUTE,
+                 max_requests_per_minute=MAX_REQUESTS_PER_MINUTE,
+                 window=RATE_WINDOW_SECONDS, clock=time.monotonic):
+        self.base_decision = decision_chance
+        self.base_selection = selection_chance
+        self.target_mpm = target_mpm
+        self.max_tpm = max_tokens_per_minute
+        self.max_rpm = max_requests_per_minute
+        self.window = window
+        self.clock = clock
+        self.gain = 1.0
+        self.lock = threading.Lock()
+
+        self._started = clock()
+        self._last_update = self._started
+        self._messages = deque()
+        self._requests = deque()  # (time, tokens)
+        self._backoff = 0.0
+        self._backoff_until = 0.0
+        self.skipped = 0
+
+    def set_clock(self, clock):
+        """Switch time source (e.g. the soak harness's virtual clock), restarting the window on it."""
+        with self.lock:
+            self.clock = clock
+            self._started = clock()
+            self._last_update = self._started
+            self._messages.clear()
+            self._requests.clear()
+            self._backoff_until = 0.0
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        while self._messages and self._messages[0] < cutoff:
+            self._messages.popleft()
+        while self._requests and self._requests[0][0] < cutoff:
+            self._requests.popleft()
+
+    def _per_minute(self, count, now):
+        elapsed = min(self.window, max(now - self._started, 1.0))
+        return count * 60.0 / elapsed
+
+    def _pressure(self, now):
+        """Fraction (0..1+) of the tightest per-minute API budget in use."""
+        pressure = 0.0
+        if self.max_rpm:
+            pressure = max(pressure, len(self._requests) * 60.0 / self.window / self.max_rpm)
+        if self.max_tpm:
+            tokens = sum(n for _, n in self._requests)
+            pressure = max(pressure, tokens * 60.0 / self.window / self.max_tpm)
+        return pressure
+
+    def _update(self, now):
+        if not self.target_mpm:
+            return
+        if now - self._started < WARMUP_SECONDS or now - self._last_update < UPDATE_INTERVAL_SECONDS:
+            return
+        self._last_update = now
+
+        measured = self._per_minute(len(self._messages), now)
+        ratio = self.target_mpm / max(measured, 0.5)
+        # Partial step in log space keeps the loop from oscillating
+        step = min(max(ratio, 0.5), 2.0) ** 0.3
+        # Past this gain both chances are already 1, so growing further only winds up
+        ceiling = min(MAX_GAIN, 1.0 / max(self.base_decision * self.base_selection, 1e-6))
+        self.gain = min(max(self.gain * step, MIN_GAIN), ceiling)
+
+    def _effective_gain(self, now):
+        gain = self.gain
+        pressure = self._pressure(now)
+        if pressure > PRESSURE_THRESHOLD:
+            gain *= max(0.0, (1.0 - pressure) / (1.0 - PRESSURE_THRESHOLD))
+        return gain
+
+    def chances(self):
+        """Current (decision, selection) probabilities."""
+        with self.lock:
+            now = self.clock()
+            self._prune(now)
+            self._update(now)
+            gain = self._effective_gain(now)
+
+        if gain >= 1.0:
+            # Raise selection first: more personas per request is cheaper than more requests
+            selection = min(1.0, self.base_selection * gain)
+            rest = gain * self.base_selection / selection if selection else gain
+            decision = min(1.0, self.base_decision * rest)
+        else:
+            # Cut requests first for the same reason
+            decision = self.base_decision * gain
+            selection = self.base_selection
+        return decision, selection
+
+    def decision_chance(self):
+        return self.chances()[0]
+
+    def selection_chance(self):
+        return self.chances()[1]
+
+    def allow_request(self, count=1, count_skip=True):
+        """Whether `count` requests may be sent now; skipped requests are dropped, not queued.
+
+        count_skip=False leaves `skipped` alone, for a second check on an
+        utterance that was already counted.
+        """
+        with self.lock:
+            now = self.clock()
+            self._prune(now)
+            allowed = now >= self._backoff_until
+            if allowed and self.max_rpm and len(self._requests) + count - 1 >= self.max_rpm * self.window / 60.0:
+                allowed = False
+            if allowed and self.max_tpm:
+                tokens = sum(n for _, n in self._requests)
+                if tokens >= self.max_tpm * self.window / 60.0:
+                    allowed = False
+            if not allowed and count_skip:
+                self.skipped += 1
+            return allowed
+
+    def record_request(self, tokens):
+        """Record a completed request and the tokens it used."""
+        with self.lock:
+            self._requests.append((self.clock(), tokens or 0))
+            self._backoff = 0.0
+
+    def record_rate_limited(self):
+        """Back off after the API reported rate limiting."""
+        with self.lock:
+            self._backoff = min(MAX_BACKOFF_SECONDS, self._backoff * 2 if self._backoff else RATE_BACKOFF_SECONDS)
+            self._backoff_until = self.clock() + self._backoff
+            print(f"Rate limited by API, pausing chat requests for {self._backoff:.0f}s")
+
+    def record_messages(self, count=1):
+        """Record messages posted to chat."""
+        with self.lock:
+            now = self.clock()
+            self._messages.extend([now] * count)
+
+    def stats(self):
+        with self.lock:
+            now = self.clock()
+            self._prune(now)
+            return {
+                "messages_per_minute": self._per_minute(len(self._messages), now),
+                "requests_per_minute": self._per_minute(len(self._requests), now),
+                "tokens_per_minute": self._per_minute(sum(n for _, n in self._requests), now),
+                "gain": self.gain,
+                "pressure": self._pressure(now),
+                "skipped": self.skipped,
+            }
+
+    def print_summary(self):
+        stats = self.stats()
+        print(f"Rate controller: {stats['messages_per_minute']:.1f} messages/min, "
+              f"{stats['requests_per_minute']:.1f} requests/min, {stats['tokens_per_minute']:.0f} tokens/min, "
+              f"gain {stats['gain']:.2f}, budget pressure {stats['pressure']:.2f}, {stats['skipped']} skipped")
@@ -0,0 +1,228 @@
+import json
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cassette import chat_completion, make_rng
+from clients import get_openai_client
+from routing import DEFAULT_MODEL_TIER, get_tier
+
+INSTANT_REACTIONS = os.getenv("INSTANT_REACTIONS", "false").lower() == "true"
+# Reactions kept ready per persona, and the level that triggers a refill
+REACTION_POOL_SIZE = int(os.getenv("REACTION_POOL_SIZE", "12"))
+REACTION_REFILL_BELOW = int(os.getenv("REACTION_REFILL_BELOW", "4"))
+# Personas per generation request
+REACTION_BATCH_PERSONAS = int(os.getenv("REACTION_BATCH_PERSONAS", "8"))
+# Recent reactions (per persona, and across chat) that won't be used or generated again
+REACTION_NO_REPEAT = int(os.getenv("REACTION_NO_REPEAT", "30"))
+# Model tier for generating reactions (see routing.py); a fast tier suits short phrases
+REACTION_TIER = os.getenv("REACTION_TIER", DEFAULT_MODEL_TIER)
+REACTION_TOKENS_PER_PERSONA = 150
+
+# Keywords for the local matcher; the category with the most hits wins
+CATEGORIES = {
+    "question": r"\b(what|why|how|who|where|when|which|should|would|could|do you|does|did|can|is it|are you)\b",
+    "hype": r"\b(let'?s go|insane|crazy|huge|win|won|clutch|amazing|awesome|hype|epic|finally|incredible)\b",
+    "funny": r"\b(lol|lmao|haha\w*|funny|joke|hilarious|ridiculous|silly)\b",
+    "sad": r"\b(sad|sorry|lost|lose|losing|died|dead|rip|unfortunately|miss|broke|failed)\b",
+    "greeting": r"\b(hello|hi|hey|welcome|good (morning|evening|night)|what'?s up|bye|goodnight)\b",
+    "agree": r"\b(right|agree|true|exactly|yeah|yes|honestly|definitely)\b",
+}
+GENERIC = "generic"
+_PATTERNS = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in CATEGORIES.items()}
+
+
+def categorize(text):
+    """Pick the reaction category for an utterance with keyword matching (microseconds, no API call)."""
+    scores = {name: len(pattern.findall(text)) for name, pattern in _PATTERNS.items()}
+    if text.rstrip().endswith("?"):
+        scores["question"] += 2
+    best = max(scores, key=scores.get)
+    return best if scores[best] else GENERIC
+
+
+def _normalize(text):
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _build_prompt(personas):
+    lines = []
+    for persona in personas:
+        line = f"- {persona['name']}: {persona.get('description', 'Chat user')}"
+        if persona.get('personality'):
+            line += f" (Personality: {persona['personality']})"
+        if persona.get('interests'):
+            line += f" (Interests: {', '.join(persona['interests'])})"
+        lines.append(line)
+    categories = ", ".join(list(CATEGORIES) + [GENERIC])
+
+    return f"""
+You write short, generic live stream chat reactions that fit any moment of a given kind.
+For each chat user below, write reactions in their own voice: 1-6 words each, no names, no specifics.
+
+Chat users:
+{chr(10).join(lines)}
+
+Give each user one reaction for each of these categories: {categories}, plus 3 more {GENERIC} ones.
+
+Respond ONLY in this exact JSON format (nothing else):
+{{
+  "reactions": {{
+    "UserName": [{{"category": "hype", "text": "LETS GOOO"}}, ...]
+  }}
+}}
+"""
+
+
+class ReactionCache:
+    """Per-persona pools of short pre-generated reactions, posted while the LLM works.
+
+    Pools are filled in the background, several personas per request, and
+    topped up whenever one runs low. A used reaction is evicted from its pool
+    and remembered, so the same phrase doesn't come back until
+    REACTION_NO_REPEAT others have been used.
+    """
+
+    def __init__(self, allow_request=None, record_request=None,
+                 pool_size=REACTION_POOL_SIZE, refill_below=REACTION_REFILL_BELOW,
+                 batch_personas=REACTION_BATCH_PERSONAS, no_repeat=REACTION_NO_REPEAT):
+        self.allow_request = allow_request
+        self.record_request = record_request
+        self.pool_size = pool_size
+        self.refill_below = refill_below
+        self.batch_personas = batch_personas
+        self.no_repeat = no_repeat
+        # Own RNG so reactions don't shift the main RNG's sequence
+        self.rng = make_rng()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reactions")
+        self.pools = {}
+        self.recent = {}
+        self.recent_all = deque(maxlen=no_repeat)
+        self._refilling = False
+        self.metrics = {"posted": 0, "empty": 0, "requests": 0, "generated": 0, "rejected": 0}
+
+    def react(self, text, personas_data, post):
+        """Post one reaction matching the utterance via post(name, message); returns it or None."""
+        category = categorize(text)
+        with self.lock:
+            recent_all = set(self.recent_all)
+            candidates = [
+                (name, i) for name, pool in self.pools.items()
+                for i, (entry_category, entry_text) in enumerate(pool)
+                if entry_category == category and _normalize(entry_text) not in recent_all
+            ]
+            if not candidates and category != GENERIC:
+                candidates = [
+                    (name, i) for name, pool in self.pools.items()
+                    for i, (entry_category, entry_text) in enumerate(pool)
+                    if entry_category == GENERIC and _normalize(entry_text) not in recent_all
+                ]
+            reaction = None
+            if candidates:
+                name, index = self.rng.choice(candidates)
+                _, message = self.pools[name].pop(index)
+                self._remember(name, message)
+                reaction = (name, message)
+                self.metrics["posted"] += 1
+            else:
+                self.metrics["empty"] += 1
+
+        self.refill(personas_data)
+        if reaction:
+            post(*reaction)
+        return reaction
+
+    def _remember(self, name, message):
+        key = _normalize(message)
+        self.recent.setdefault(name, deque(maxlen=self.no_repeat)).append(key)
+        self.recent_all.append(key)
+
+    def refill(self, personas_data):
+        """Top up low pools on the background thread (one request in flight at a time).
+
+        Keeps going batch by batch until no pool is low.
+        """
+        personas = personas_data.get('personas', [])
+        with self.lock:
+            if self._refilling:
+                return
+            names = {p['name'] for p in personas}
+            # Forget personas no longer in personas.json
+            for name in list(self.pools):
+                if name not in names:
+                    del self.pools[name]
+                    self.recent.pop(name, None)
+            low = sorted(
+                (p for p in personas if len(self.pools.get(p['name'], [])) < self.refill_below),
+                key=lambda p: len(self.pools.get(p['name'], [])),
+            )[:self.batch_personas]
+            if not low:
+                return
+            if self.allow_request and not self.allow_request():
+                return
+            self._refilling = True
+        self.executor.submit(self._refill, low, personas_data)
+
+    def _refill(self, personas, personas_data):
+        added = 0
+        try:
+            _, tier = get_tier(REACTION_TIER, personas_data)
+            response = chat_completion(
+                get_openai_client,
+                cassette_tag="reactions",
+                model=tier["model"],
+                messages=[{"role": "system", "content": _build_prompt(personas)}],
+                temperature=tier["temperature"],
+                max_tokens=max(tier["max_tokens"], len(personas) * REACTION_TOKENS_PER_PERSONA),
+                response_format={"type": "json_object"},
+            )
+            usage = getattr(response, "usage", None)
+            if self.record_request:
+                self.record_request(getattr(usage, "total_tokens", 0))
+            generated = json.loads(response.choices[0].message.content.strip()).get("reactions", {})
+            added = self._add(generated if isinstance(generated, dict) else {}, {p['name'] for p in personas})
+        except Exception as e:
+            print(f"Error generating reactions: {e}")
+        finally:
+            with self.lock:
+                self._refilling = False
+                self.metrics["requests"] += 1
+        # Next batch, unless this one produced nothing usable (don't spin on a bad model)
+        if added:
+            self.refill(personas_data)
+
+    def _add(self, generated, names):
+        """Add generated reactions for the requested personas; returns how many were added."""
+        categories = set(CATEGORIES) | {GENERIC}
+        added = 0
+        with self.lock:
+            for name, entries in generated.items():
+                if name not in names or not isinstance(entries, list):
+                    continue
+                pool = self.pools.setdefault(name, [])
+                seen = set(self.recent.get(name, ())) | {_normalize(t) for _, t in pool}
+                for entry in entries:
+                    if len(pool) >= self.pool_size:
+                        break
+                    if not isinstance(entry, dict):
+                        continue
+                    category = entry.get("category") if entry.get("category") in categories else GENERIC
+                    text = str(entry.get("text", "")).strip()
+                    key = _normalize(text)
+                    if not key or key in seen or len(text) > 80:
+                        self.metrics["rejected"] += 1
+                        continue
+                    seen.add(key)
+                    pool.append((category, text))
+                    added += 1
+            self.metrics["generated"] += added
+        return added
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats["pooled"] = sum(len(pool) for pool in self.pools.values())
+        return stats
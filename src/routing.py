@@ -0,0 +1,131 @@
+import os
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tier used by personas without a "tier" field
+DEFAULT_MODEL_TIER = os.getenv("DEFAULT_MODEL_TIER", "default")
+# Tier used for persona generation requests (empty: the generation settings in persona_generation.py)
+PERSONA_GENERATION_TIER = os.getenv("PERSONA_GENERATION_TIER", "").strip()
+# Most tier requests sent concurrently for one utterance
+TIER_MAX_CONCURRENCY = int(os.getenv("TIER_MAX_CONCURRENCY", "4"))
+
+# Latency samples kept per tier for percentiles
+LATENCY_SAMPLES = 200
+
+
+def _env_tier():
+    """The built-in "default" tier, from the existing OPENAI_MODEL_NAME/MAX_TOKENS/TEMPERATURE."""
+    return {
+        "model": os.getenv("OPENAI_MODEL_NAME", "gpt-3.5-turbo"),
+        "max_tokens": int(os.getenv("MAX_TOKENS", "150")),
+        "temperature": float(os.getenv("TEMPERATURE", "0.7")),
+    }
+
+
+_config_tiers = None
+
+
+def _load_config_tiers():
+    """Tiers from config.json's "model_tiers" (read once)."""
+    global _config_tiers
+    if _config_tiers is None:
+        from settings import load_config
+
+        tiers = load_config().get("model_tiers")
+        _config_tiers = tiers if isinstance(tiers, dict) else {}
+    return _config_tiers
+
+
+def get_tiers(personas_data=None):
+    """All tiers: the env default, then config.json "model_tiers", then personas.json "tiers".
+
+    A tier only needs the fields it changes; the rest come from the default tier.
+    """
+    base = _env_tier()
+    tiers = {"default": dict(base)}
+    sources = [_load_config_tiers()]
+    if personas_data and isinstance(personas_data.get("tiers"), dict):
+        sources.append(personas_data["tiers"])
+    for source in sources:
+        for name, settings in source.items():
+            if isinstance(settings, dict):
+                tier = dict(tiers.get(name, base))
+                tier.update({k: v for k, v in settings.items() if k in ("model", "max_tokens", "temperature")})
+                tiers[name] = tier
+    return tiers
+
+
+def get_tier(name, personas_data=None):
+    """Settings for a tier, falling back to the default tier for unknown names."""
+    tiers = get_tiers(personas_data)
+    if name not in tiers:
+        print(f"Unknown model tier '{name}', using default")
+        return "default", tiers["default"]
+    return name, tiers[name]
+
+
+def group_by_tier(active_personas, personas_data=None):
+    """Split personas into {tier name: (tier settings, [personas])}."""
+    tiers = get_tiers(personas_data)
+    default = DEFAULT_MODEL_TIER if DEFAULT_MODEL_TIER in tiers else "default"
+    groups = {}
+    for persona in active_personas:
+        name = persona.get("tier") or default
+        if name not in tiers:
+            name = default
+        groups.setdefault(name, (tiers[name], []))[1].append(persona)
+    return groups
+
+
+class TierStats:
+    """Per-tier request count, latency and token usage."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tiers = {}
+
+    def record(self, tier, latency, usage=None, error=False):
+        with self.lock:
+            stats = self.tiers.setdefault(tier, {
+                "requests": 0,
+                "errors": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "latencies": deque(maxlen=LATENCY_SAMPLES),
+            })
+            stats["requests"] += 1
+            if error:
+                stats["errors"] += 1
+            stats["latencies"].append(latency)
+            if usage is not None:
+                stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def snapshot(self):
+        """{tier: {requests, errors, tokens, p50/p95 latency}}."""
+        with self.lock:
+            result = {}
+            for tier, stats in self.tiers.items():
+                latencies = sorted(stats["latencies"])
+                result[tier] = {
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "completion_tokens": stats["completion_tokens"],
+                    "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+                    "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                }
+            return result
+
+    def print_summary(self):
+        for tier, stats in self.snapshot().items():
+            print(f"Tier '{tier}': {stats['requests']} requests ({stats['errors']} errors), "
+                  f"p50 {stats['latency_p50']:.2f}s, p95 {stats['latency_p95']:.2f}s, "
+                  f"{stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion tokens")
+
+
+tier_stats = TierStats()
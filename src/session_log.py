@@ -0,0 +1,247 @@
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+SESSION_LOG = os.getenv("SESSION_LOG", "true").lower() == "true"
+SESSION_LOG_FILE = os.getenv("SESSION_LOG_FILE", "session/session.jsonl")
+SESSION_CHECKPOINT_FILE = os.getenv("SESSION_CHECKPOINT_FILE", "session/checkpoint.json")
+# How often the compact checkpoint is rewritten
+SESSION_CHECKPOINT_SECONDS = float(os.getenv("SESSION_CHECKPOINT_SECONDS", "60"))
+# Log size before it is rotated to .1 (the checkpoint carries the state across)
+SESSION_LOG_MAX_BYTES = int(os.getenv("SESSION_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+# Conversation restored on startup, and the age limit for resuming unposted messages
+SESSION_RESTORE_MINUTES = float(os.getenv("SESSION_RESTORE_MINUTES", "10"))
+# Memory entries held in the checkpoint (the same limit as agent.conversation_memory)
+SESSION_MEMORY_LIMIT = int(os.getenv("CONVERSATION_MEMORY_LIMIT", "200"))
+
+SESSION_VERSION = 1
+
+
+class SessionLog:
+    """Append-only JSON-lines log of conversation memory and scheduled chat posts.
+
+    Events:
+        {"type": "memory", "t": ..., "speaker": ..., "text": ...}
+        {"type": "scheduled", "t": ..., "items": [{"id", "name", "message"}, ...]}
+        {"type": "done", "t": ..., "ids": [...]}
+
+    The state they build (recent memory, messages scheduled but not yet
+    posted) is written to a small checkpoint with the log offset it covers,
+    so startup loads the checkpoint and replays only the log after it.
+    """
+
+    def __init__(self, path=SESSION_LOG_FILE, checkpoint_path=SESSION_CHECKPOINT_FILE,
+                 checkpoint_seconds=SESSION_CHECKPOINT_SECONDS, max_bytes=SESSION_LOG_MAX_BYTES,
+                 memory_limit=SESSION_MEMORY_LIMIT):
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_seconds = checkpoint_seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.memory = deque(maxlen=memory_limit)
+        self.pending = {}
+        self.log_id = None
+        # Post IDs are unique per run, since the log outlives the process
+        self._run_id = uuid.uuid4().hex[:8]
+        self._ids = itertools.count(1)
+        self._file = None
+        self._last_checkpoint = time.monotonic()
+
+        for directory in {os.path.dirname(path), os.path.dirname(checkpoint_path)}:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        started = time.perf_counter()
+        replayed = self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self.log_id is None:
+            self._new_log()
+        if replayed or self.memory or self.pending:
+            print(f"Session log loaded in {(time.perf_counter() - started) * 1000:.1f} ms "
+                  f"({replayed} events after checkpoint)")
+        if replayed:
+            # Don't replay the same tail again on the next start
+            self._checkpoint()
+
+    def _read_header(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.loads(f.readline()).get("id")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _load(self):
+        """Restore state from the checkpoint plus the log tail; returns events replayed."""
+        self.log_id = self._read_header()
+        if self.log_id is None:
+            return 0
+
+        offset = 0
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            # A checkpoint for a rotated-away log only carries state; replay this log from the start
+            if checkpoint.get("log_id") == self.log_id:
+                offset = checkpoint.get("offset", 0)
+            self.memory.extend(tuple(entry) for entry in checkpoint.get("memory", []))
+            self.pending.update(checkpoint.get("pending", {}))
+        except (OSError, ValueError):
+            pass
+
+        replayed = 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Line cut off by a crash
+                    continue
+                self._apply(event)
+                replayed += 1
+        return replayed
+
+    def _apply(self, event):
+        kind = event.get("type")
+        if kind == "memory":
+            self.memory.append((event["t"], event["speaker"], event["text"]))
+        elif kind == "scheduled":
+            for item in event["items"]:
+                self.pending[item["id"]] = {"t": event["t"], "name": item["name"], "message": item["message"]}
+        elif kind == "done":
+            for post_id in event["ids"]:
+                self.pending.pop(post_id, None)
+
+    def _new_log(self):
+        self.log_id = uuid.uuid4().hex[:12]
+        self._file.write(json.dumps({"type": "header", "id": self.log_id, "version": SESSION_VERSION}) + "\n")
+        self._file.flush()
+
+    def _append(self, event):
+        with self.lock:
+            self._apply(event)
+            self._file.write(json.dumps(event, separators=(",", ":")) + "\n")
+            # Flush each event so a crash loses at most the line being written
+            self._file.flush()
+            if time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds:
+                self._checkpoint()
+
+    def _checkpoint(self):
+        """Write the current state atomically (caller holds the lock)."""
+        if self._file.tell() >= self.max_bytes:
+            self._file.close()
+            os.replace(self.path, f"{self.path}.1")
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._new_log()
+
+        checkpoint = {
+            "version": SESSION_VERSION,
+            "log_id": self.log_id,
+            "offset": self._file.tell(),
+            "memory": list(self.memory),
+            "pending": self.pending,
+        }
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        fd, temp_path = tempfile.mkstemp(prefix=".checkpoint-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(checkpoint, f, separators=(",", ":"))
+            os.replace(temp_path, self.checkpoint_path)
+        except Exception as e:
+            print(f"Error writing session checkpoint: {e}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        self._last_checkpoint = time.monotonic()
+
+    def record_memory(self, speaker, text, t=None):
+        self._append({"type": "memory", "t": t or time.time(), "speaker": speaker, "text": text})
+
+    def schedule(self, responses):
+        """Log responses about to be posted; returns their IDs for mark_done."""
+        items = [{"id": f"{self._run_id}-{next(self._ids)}", "name": r.get("name", "Unknown"),
+                  "message": r.get("message", "")} for r in responses]
+        self._append({"type": "scheduled", "t": time.time(), "items": items})
+        return [item["id"] for item in items]
+
+    def mark_done(self, *post_ids):
+        """Log scheduled responses as posted (or skipped)."""
+        if post_ids:
+            self._append({"type": "done", "t": time.time(), "ids": list(post_ids)})
+
+    def restore(self, minutes=SESSION_RESTORE_MINUTES):
+        """Memory entries from the last `minutes` and pending responses to post again.
+
+        Returns ([(t, speaker, text)], [{"name", "message"}]). The pending
+        responses are marked done here; posting them schedules them afresh.
+        """
+        cutoff = time.time() - minutes * 60
+        with self.lock:
+            entries = [entry for entry in self.memory if entry[0] >= cutoff]
+            pending = [{"name": p["name"], "message": p["message"]}
+                       for p in self.pending.values() if p["t"] >= cutoff]
+            stale = list(self.pending)
+        self.mark_done(*stale)
+        return entries, pending
+
+    def checkpoint(self):
+        with self.lock:
+            self._checkpoint()
+
+    def close(self):
+        with self.lock:
+            if self._file:
+                self._checkpoint()
+                self._file.close()
+                self._file = None
+
+
+class _NullSessionLog:
+    """Used when SESSION_LOG is off."""
+
+    def record_memory(self, speaker, text, t=None):
+        pass
+
+    def schedule(self, responses):
+        return [None] * len(responses)
+
+    def mark_done(self, *post_ids):
+        pass
+
+    def restore(self, minutes=SESSION_RESTORE_MINUTES):
+        return [], []
+
+    def checkpoint(self):
+        pass
+
+    def close(self):
+        pass
+
+
+_session_log = None
+_session_lock = threading.Lock()
+
+
+def get_session_log():
+    """Shared session log configured from the environment."""
+    global _session_log
+    if _session_log is None:
+        with _session_lock:
+            if _session_log is None:
+                _session_log = SessionLog() if SESSION_LOG else _NullSessionLog()
+    return _session_log
+
+
+def configure_session_log(enabled=SESSION_LOG):
+    """Replace the shared session log, e.g. to keep a cassette replay out of it."""
+    global _session_log
+    with _session_lock:
+        if _session_log:
+            _session_log.close()
+        _session_log = SessionLog() if enabled else _NullSessionLog()
+    return _session_log
@@ -2,7 +2,6 @@ import json
 import subprocess
 import os
 import sys
-import pyaudio
 
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "../config.json")
 
@@ -24,6 +23,8 @@ def get_audio_devices():
     """Get list of available audio input devices."""
     devices = []
     try:
+        import pyaudio
+
         p = pyaudio.PyAudio()
         
         # Add default device option
@@ -55,12 +56,34 @@ def get_audio_devices():
     
     return devices
 
+def test_audio_device(device):
+    """Open and close an input stream on a device. Raises on failure, returns a status message."""
+    import pyaudio
+
+    p = pyaudio.PyAudio()
+    try:
+        stream = p.open(format=pyaudio.paInt16,
+                        channels=1,
+                        rate=44100,
+                        input=True,
+                        input_device_index=device['index'],
+                        frames_per_buffer=1024)
+        stream.close()
+    finally:
+        p.terminate()
+
+    if device['index'] is None:
+        return "Default device is working correctly!"
+    return f"Device '{device['name']}' is working correctly!"
+
 def load_config():
     """Load configuration from file, create default if doesn't exist."""
     default_config = {
         "example_setting": True,
         "input_device": None,
-        "input_device_name": "Default"
+        "input_device_name": "Default",
+        # Used when the input device disappears mid-stream
+        "fallback_input_device_name": "Default"
     }
     
     if not os.path.exists(CONFIG_FILE):
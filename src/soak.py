@@ -0,0 +1,223 @@
+"""Accelerated soak test: hours of streaming on a virtual clock with stubbed STT/LLM.
+
+Drives the real AudioStreamer -> agent pipeline, snapshots heap, RSS, open
+file descriptors and thread count at intervals, and fails if any of them
+grows faster than its allowed slope.
+
+    fleetcast soak --hours 8
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# Allowed growth per virtual hour, after warm-up
+SOAK_MAX_HEAP_KB_PER_HOUR = float(os.getenv("SOAK_MAX_HEAP_KB_PER_HOUR", "256"))
+SOAK_MAX_RSS_MB_PER_HOUR = float(os.getenv("SOAK_MAX_RSS_MB_PER_HOUR", "4"))
+SOAK_MAX_FDS_PER_HOUR = float(os.getenv("SOAK_MAX_FDS_PER_HOUR", "0.5"))
+SOAK_MAX_THREADS_PER_HOUR = float(os.getenv("SOAK_MAX_THREADS_PER_HOUR", "0.5"))
+
+WORDS = ("the game chat stream today play build new level boss fight loot update bug "
+         "patch team win lose crazy clip music setup keyboard coffee question").split()
+
+
+class VirtualClock:
+    """Monotonic clock that only moves when something sleeps on it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        with self.lock:
+            self.now += max(0.0, seconds)
+
+    async def async_sleep(self, seconds):
+        self.advance(seconds)
+
+
+class StubRecognizer:
+    """Stands in for speech_recognition.Recognizer; returns random sentences."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def recognize_google(self, audio):
+        return " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(4, 20)))
+
+
+class StubCompletions:
+    """Stands in for client.chat.completions; answers for the personas in the prompt."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def create(self, **kwargs):
+        system = kwargs["messages"][0]["content"]
+        names = re.findall(r"^- ([^:\n]+):", system, re.MULTILINE) or ["Someone"]
+        responses = [
+            {"name": name, "message": " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(1, 10)))}
+            for name in names
+        ]
+        content = json.dumps({"responses": responses})
+        prompt_tokens = len(system) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+        )
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        # Peak rather than current RSS, but still catches steady growth
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _open_fds():
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return 0
+
+
+def take_snapshot(clock):
+    current, _ = tracemalloc.get_traced_memory()
+    return {
+        "hours": clock.now / 3600,
+        "heap_kb": current / 1024,
+        "rss_mb": _rss_bytes() / (1024 * 1024),
+        "fds": _open_fds(),
+        "threads": threading.active_count(),
+    }
+
+
+def slope(points):
+    """Least-squares slope of (x, y) points."""
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def run_soak(hours, snapshot_minutes, seed, limits):
+    """Run the soak and return (snapshots, failures)."""
+    import agent
+    import clients
+    from audio_streamer import AUDIO_PROCESS_SECONDS, AudioStreamer
+
+    # Isolated working directory for personas.json and the chat output file
+    workdir = tempfile.mkdtemp(prefix="fleetcast-soak-")
+    os.chdir(workdir)
+    rng = random.Random(seed)
+    with open("personas.json", "w") as f:
+        json.dump({"personas": [
+            {"name": f"viewer{i}", "description": "Regular viewer", "interests": ["games"]}
+            for i in range(30)
+        ]}, f)
+
+    clock = VirtualClock()
+
+    clients.set_openai_client(SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(rng))))
+    agent.rng.seed(seed)
+    agent.post_sleep = clock.async_sleep
+    agent.rate_controller.set_clock(clock)
+    agent.OUTPUT_FILE = os.path.join(workdir, "output.txt")
+
+    streamer = AudioStreamer({"input_device": None, "input_device_name": "Default"},
+                             text_callback=agent.on_text_received)
+    streamer.recognizer = StubRecognizer(rng)
+    silence = bytes(streamer.chunk * 2)
+    chunks_per_window = int(AUDIO_PROCESS_SECONDS * streamer.rate / streamer.chunk)
+
+    tracemalloc.start()
+    snapshots = []
+    next_snapshot = 0.0
+    end = hours * 3600
+    started = time.monotonic()
+
+    while clock.now < end:
+        for _ in range(chunks_per_window):
+            streamer.feed(silence)
+        clock.advance(AUDIO_PROCESS_SECONDS)
+        streamer._convert_to_text()
+
+        if clock.now >= next_snapshot:
+            snapshots.append(take_snapshot(clock))
+            next_snapshot += snapshot_minutes * 60
+            last = snapshots[-1]
+            print(f"[soak] {last['hours']:5.2f}h heap={last['heap_kb']:.0f}KB rss={last['rss_mb']:.1f}MB "
+                  f"fds={last['fds']} threads={last['threads']}", flush=True)
+
+    tracemalloc.stop()
+    print(f"[soak] {hours}h simulated in {time.monotonic() - started:.1f}s real time")
+    agent.tier_stats.print_summary()
+    agent.rate_controller.print_summary()
+
+    # Ignore the first 10% while caches and pools warm up
+    steady = [s for s in snapshots if s["hours"] >= hours * 0.1]
+    failures = []
+    for key, limit, unit in (
+        ("heap_kb", limits["heap_kb"], "KB"),
+        ("rss_mb", limits["rss_mb"], "MB"),
+        ("fds", limits["fds"], "fds"),
+        ("threads", limits["threads"], "threads"),
+    ):
+        growth = slope([(s["hours"], s[key]) for s in steady])
+        status = "ok" if growth <= limit else "FAIL"
+        print(f"[soak] {key}: {growth:+.2f} {unit}/hour (limit {limit}) [{status}]")
+        if status != "ok":
+            failures.append(key)
+    return snapshots, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fleetcast soak test")
+    parser.add_argument("--hours", type=float, default=8, help="Virtual hours to simulate")
+    parser.add_argument("--snapshot-minutes", type=float, default=10, help="Virtual minutes between snapshots")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-heap-kb-per-hour", type=float, default=SOAK_MAX_HEAP_KB_PER_HOUR)
+    parser.add_argument("--max-rss-mb-per-hour", type=float, default=SOAK_MAX_RSS_MB_PER_HOUR)
+    parser.add_argument("--max-fds-per-hour", type=float, default=SOAK_MAX_FDS_PER_HOUR)
+    parser.add_argument("--max-threads-per-hour", type=float, default=SOAK_MAX_THREADS_PER_HOUR)
+    args = parser.parse_args(argv)
+
+    _, failures = run_soak(args.hours, args.snapshot_minutes, args.seed, {
+        "heap_kb": args.max_heap_kb_per_hour,
+        "rss_mb": args.max_rss_mb_per_hour,
+        "fds": args.max_fds_per_hour,
+        "threads": args.max_threads_per_hour,
+    })
+    if failures:
+        print(f"[soak] FAILED: {', '.join(failures)} grew faster than allowed")
+        return 1
+    print("[soak] passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import difflib
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() == "true"
+# Seconds between partial transcriptions while the speaker is talking
+SPECULATIVE_INTERVAL_SECONDS = float(os.getenv("SPECULATIVE_INTERVAL_SECONDS", "3"))
+# Cap on speculative LLM requests, on top of the rate controller's budget
+SPECULATIVE_MAX_PER_MINUTE = int(os.getenv("SPECULATIVE_MAX_PER_MINUTE", "6"))
+# Word similarity (0-1) between partial and final transcript needed to commit
+SPECULATIVE_MATCH_THRESHOLD = float(os.getenv("SPECULATIVE_MATCH_THRESHOLD", "0.75"))
+# Partials shorter than this aren't worth a request
+SPECULATIVE_MIN_WORDS = int(os.getenv("SPECULATIVE_MIN_WORDS", "4"))
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def text_similarity(a, b):
+    """Word-level similarity of two transcripts (0-1)."""
+    return difflib.SequenceMatcher(None, _words(a), _words(b)).ratio()
+
+
+class Speculation:
+    def __init__(self, text, future, speaker=None):
+        self.text = text
+        self.future = future
+        self.speaker = speaker
+        self.started = time.monotonic()
+
+
+class Speculator:
+    """Starts LLM requests on partial transcripts and commits them if the final text matches.
+
+    generate(text) is the normal request function (api_call_structured). A
+    speculation that doesn't match the final transcript is discarded; the HTTP
+    call can't be aborted mid-flight, so its result is simply ignored. Final
+    transcripts from another speaker than the partials' leave it in flight.
+    """
+
+    def __init__(self, generate, allow_request=None,
+                 max_per_minute=SPECULATIVE_MAX_PER_MINUTE,
+                 match_threshold=SPECULATIVE_MATCH_THRESHOLD,
+                 min_words=SPECULATIVE_MIN_WORDS):
+        self.generate = generate
+        self.allow_request = allow_request
+        self.max_per_minute = max_per_minute
+        self.match_threshold = match_threshold
+        self.min_words = min_words
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculate")
+        self.current = None
+        # Outcome of the last take(): None, "hit" or "miss"
+        self.last_outcome = None
+        self._started_times = deque()
+        self.metrics = {
+            "started": 0,
+            "hits": 0,
+            "misses": 0,
+            "superseded": 0,
+            "skipped_budget": 0,
+            "head_start_seconds": 0.0,
+        }
+
+    def _within_budget(self):
+        now = time.monotonic()
+        while self._started_times and self._started_times[0] < now - 60:
+            self._started_times.popleft()
+        if self.max_per_minute and len(self._started_times) >= self.max_per_minute:
+            return False
+        if self.allow_request and not self.allow_request():
+            return False
+        return True
+
+    def _other_speaker(self, speaker):
+        """Whether speaker's transcript belongs to someone other than the current speculation's."""
+        current = self.current
+        return (current is not None and speaker is not None and current.speaker is not None
+                and speaker != current.speaker)
+
+    def on_partial(self, text, speaker=None):
+        """Start (or restart) a speculative request for the speech captured so far."""
+        if len(_words(text)) < self.min_words:
+            return
+
+        with self.lock:
+            if self.current and text_similarity(text, self.current.text) >= self.match_threshold:
+                # Still the same sentence; keep the request already in flight
+                return
+            if not self._within_budget():
+                self.metrics["skipped_budget"] += 1
+                return
+            if self.current:
+                self.metrics["superseded"] += 1
+            self._started_times.append(time.monotonic())
+            self.metrics["started"] += 1
+            self.current = Speculation(text, self.executor.submit(self.generate, text), speaker)
+
+    def take(self, final_text, speaker=None):
+        """Return the speculative responses if they match final_text, else None."""
+        with self.lock:
+            if self._other_speaker(speaker):
+                self.last_outcome = None
+                return None
+            speculation, self.current = self.current, None
+
+        self.last_outcome = "miss"
+        if not speculation:
+            self.last_outcome = None
+            return None
+
+        similarity = text_similarity(speculation.text, final_text)
+        if similarity < self.match_threshold:
+            self.metrics["misses"] += 1
+            print(f"Speculation missed (similarity {similarity:.2f}), reissuing")
+            return None
+
+        head_start = time.monotonic() - speculation.started
+        try:
+            responses = speculation.future.result()
+        except Exception as e:
+            print(f"Speculative request failed: {e}")
+            self.metrics["misses"] += 1
+            return None
+
+        self.metrics["hits"] += 1
+        self.metrics["head_start_seconds"] += head_start
+        self.last_outcome = "hit"
+        return responses
+
+    def discard(self, speaker=None):
+        """Drop any in-flight speculation (e.g. chat decided not to respond)."""
+        with self.lock:
+            if self._other_speaker(speaker):
+                return
+            if self.current:
+                self.metrics["misses"] += 1
+            self.current = None
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+        decided = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / decided if decided else 0.0
+        return stats
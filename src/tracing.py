@@ -0,0 +1,188 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+
+TRACING = os.getenv("TRACING", "false").lower() == "true"
+# {pid} is replaced so each process (see process_runtime.py) writes its own file
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/trace-{pid}.json")
+# Events per file before it is rotated to .1, .2, ...
+TRACE_MAX_EVENTS = int(os.getenv("TRACE_MAX_EVENTS", "50000"))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "5"))
+
+_trace_id = contextvars.ContextVar("fleetcast_trace_id", default=None)
+_trace_counter = itertools.count(1)
+
+
+class _NullSpan:
+    """Returned when tracing is off; every method is a no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class TraceWriter:
+    """Appends Chrome trace-event JSON to a rotating file.
+
+    Files are written in the JSON array format ("[" then comma-separated
+    events). The closing "]" is optional for trace viewers, so a file cut off
+    by a crash still opens.
+    """
+
+    def __init__(self, path=TRACE_FILE, max_events=TRACE_MAX_EVENTS, backup_count=TRACE_BACKUP_COUNT):
+        self.path = path.format(pid=os.getpid())
+        self.max_events = max_events
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+        self._file = None
+        self._count = 0
+        self._named_threads = set()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write("[")
+        self._count = 0
+        self._named_threads = set()
+        self._write_event({"name": "process_name", "ph": "M", "pid": os.getpid(),
+                           "args": {"name": "fleetcast"}})
+
+    def _rotate(self):
+        self._file.write("\n]\n")
+        self._file.close()
+        self._file = None
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+
+    def _write_event(self, event):
+        self._file.write(("\n" if self._count == 0 else ",\n") + json.dumps(event, separators=(",", ":"), default=str))
+        self._count += 1
+
+    def write(self, event):
+        with self.lock:
+            if self._file is None:
+                self._open()
+            elif self._count >= self.max_events:
+                self._rotate()
+                self._open()
+
+            tid = event["tid"]
+            if tid not in self._named_threads:
+                self._named_threads.add(tid)
+                self._write_event({"name": "thread_name", "ph": "M", "pid": event["pid"], "tid": tid,
+                                   "args": {"name": threading.current_thread().name}})
+            self._write_event(event)
+            self._file.flush()
+
+    def close(self):
+        with self.lock:
+            if self._file:
+                self._file.write("\n]\n")
+                self._file.close()
+                self._file = None
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = TraceWriter()
+    return _writer
+
+
+class Span:
+    """Complete ("X") trace event timed from __enter__ to __exit__."""
+
+    __slots__ = ("name", "attrs", "start")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        args = dict(self.attrs)
+        trace_id = _trace_id.get()
+        if trace_id:
+            args["trace_id"] = trace_id
+        if exc_type is not None:
+            args["error"] = f"{exc_type.__name__}: {exc}"
+        _get_writer().write({
+            "name": self.name,
+            "cat": "fleetcast",
+            "ph": "X",
+            "ts": self.start / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+        return False
+
+    def set(self, **attrs):
+        """Add attributes known only after the span started (token counts etc.)."""
+        self.attrs.update(attrs)
+
+
+def span(name, **attrs):
+    """Context manager timing a block; a shared no-op object when tracing is off."""
+    if not TRACING:
+        return NULL_SPAN
+    return Span(name, attrs)
+
+
+class _Trace:
+    __slots__ = ("token",)
+
+    def __enter__(self):
+        self.token = None
+        if _trace_id.get() is None:
+            self.token = _trace_id.set(f"{os.getpid():x}-{next(_trace_counter):06d}")
+        return self
+
+    def __exit__(self, *exc):
+        if self.token is not None:
+            _trace_id.reset(self.token)
+        return False
+
+
+def trace():
+    """Give spans in this block a new trace ID, unless one is already active.
+
+    One trace covers one utterance, from WAV build through the last delayed post.
+    """
+    if not TRACING:
+        return NULL_SPAN
+    return _Trace()
+
+
+def close():
+    if _writer:
+        _writer.close()